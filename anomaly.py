@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+
+#******************************************
+#Streaming anomaly detection on climate chamber readings during thermal cycling programs.
+
+#******************************************
+__author__ = "Francesco Guescini"
+__version__ = "0.0.0"
+
+#******************************************
+#import stuff
+import logging, math, time
+from collections import deque, namedtuple
+import climatechambercontroller
+
+#******************************************
+#anomalies
+#kind: stuck, stall, oscillation, warning, error
+#action: None (log only), climatechambercontroller.PAUSE or climatechambercontroller.ABORT
+anomaly = namedtuple("anomaly", ["kind", "action", "message"])
+
+#climate chamber status codes
+WARNING = 4
+ERROR = 8
+
+#******************************************
+class window:
+    """Rolling window of (time, value) samples with O(1) mean and standard deviation."""
+
+    #******************************************
+    def __init__(self, size):
+        self.samples = deque(maxlen=size)
+        self.sum = 0.
+        self.sum2 = 0.
+        return
+
+    #******************************************
+    def add(self, t, value):
+        if len(self.samples) == self.samples.maxlen:
+            _, old = self.samples[0]
+            self.sum -= old
+            self.sum2 -= old*old
+        self.samples.append((t, value))
+        self.sum += value
+        self.sum2 += value*value
+        return
+
+    #******************************************
+    def clear(self):
+        self.samples.clear()
+        self.sum = 0.
+        self.sum2 = 0.
+        return
+
+    #******************************************
+    def full(self):
+        return len(self.samples) == self.samples.maxlen
+
+    #******************************************
+    def std(self):
+        n = len(self.samples)
+        if n < 2:
+            return 0.
+        return math.sqrt(max(0., self.sum2/n - (self.sum/n)**2))
+
+#******************************************
+class detector:
+    """Detect anomalies in the readings of a running program.
+
+    - stuck: the actual temperature does not change at all while far from the step target (abort);
+    - stall: the actual temperature approaches the step target slower than the minimum rate while far from it (abort);
+    - oscillation: the actual temperature crosses the setpoint band repeatedly while dwelling (log only);
+    - warning: the climate chamber reports a warning status (pause until it clears);
+    - error: the climate chamber reports an error status (abort).
+
+    Each reading is processed in constant time over rolling windows of the last samples.
+    The windows restart at each step and dwell, but not at the setpoint changes along a ramp-rate-limited trajectory:
+    the progress of a ramp is measured toward the step target.
+    """
+
+    #******************************************
+    def __init__(self, tolerance=0.1, samples=150, stuck=0.005, distance=1.0, stall=0.02, crossings=4, clock=None):
+        """Initialize the detector.
+
+        samples: window size [readings];
+        stuck: standard deviation [C] below which the sensor is considered stuck;
+        distance: distance [C] from the step target beyond which stuck sensors and stalled ramps are detected;
+        stall: minimum rate [C/minute] at which the step target must be approached;
+        crossings: number of setpoint band crossings within the window considered an oscillation.
+        """
+
+        self.tolerance = tolerance
+        self.stuck = stuck
+        self.distance = distance
+        self.stall = stall
+        self.crossings = crossings
+        self.clock = clock if clock is not None else time
+
+        #state
+        self.readings = window(samples)
+        self.crossed = deque(maxlen=samples)
+        self.ncrossings = 0
+        self.side = 0
+        self.target = None
+        self.dwelling = False
+        self.warned = False
+        self.status = None
+        self.anomalies = []
+
+        return
+
+    #******************************************
+    def __raise__(self, kind, action, message):
+        """Record and log an anomaly."""
+
+        event = anomaly(kind, action, message)
+        self.anomalies.append(event)
+        if action == climatechambercontroller.ABORT:
+            logging.error("%s: %s"%(kind, message))
+        else:
+            logging.warning("%s: %s"%(kind, message))
+
+        return event
+
+    #******************************************
+    def reset(self, dwelling=False, target=None):
+        """Start a new ramp (toward a target) or dwell phase."""
+
+        self.readings.clear()
+        self.crossed.clear()
+        self.ncrossings = 0
+        self.side = 0
+        self.dwelling = dwelling
+        self.warned = False
+        if target is not None:
+            self.target = target
+
+        return
+
+    #******************************************
+    def update(self, actual, setpoint, status=None):
+        """Process a reading and return the detected anomalies."""
+
+        now = self.clock.time()
+        anomalies = []
+
+        #------------------------------------------
+        #status transitions
+        if status is not None and status != self.status:
+            if status == ERROR:
+                anomalies.append(self.__raise__("error", climatechambercontroller.ABORT, "the climate chamber reports an error"))
+            elif status == WARNING:
+                anomalies.append(self.__raise__("warning", climatechambercontroller.PAUSE, "the climate chamber reports a warning: pausing"))
+            elif self.status == WARNING:
+                logging.info("the climate chamber warning cleared: resuming")
+            self.status = status
+        elif status == WARNING:
+            anomalies.append(anomaly("warning", climatechambercontroller.PAUSE, "the climate chamber reports a warning: pausing"))
+
+        #------------------------------------------
+        #rolling statistics
+        #NOTE without a step target (e.g. outside of cycle) the setpoint is the target
+        target = self.target if self.target is not None else setpoint
+        self.readings.add(now, actual)
+        error = actual - setpoint
+
+        #------------------------------------------
+        #ramp: stuck sensor and stalled ramp
+        if not self.dwelling and self.readings.full() and abs(actual - target) > self.distance:
+            (t0, first), (t1, last) = self.readings.samples[0], self.readings.samples[-1]
+            if self.readings.std() < self.stuck:
+                anomalies.append(self.__raise__("stuck", climatechambercontroller.ABORT,
+                    "the actual temperature has been %.2f C for %.0f s while the target is %.2f C"%(actual, t1 - t0, target)))
+            elif t1 > t0 and 60.*(abs(first - target) - abs(actual - target))/(t1 - t0) < self.stall:
+                anomalies.append(self.__raise__("stall", climatechambercontroller.ABORT,
+                    "the actual temperature (%.2f C) approaches the target (%.2f C) slower than %.2f C/minute"%(actual, target, self.stall)))
+
+        #------------------------------------------
+        #dwell: oscillation around the setpoint
+        #NOTE a crossing is counted when the reading moves from one side of the tolerance band to the other
+        if self.dwelling:
+            side = 1 if error > self.tolerance else -1 if error < -self.tolerance else 0
+            crossing = side != 0 and self.side != 0 and side != self.side
+            if side != 0:
+                self.side = side
+            if len(self.crossed) == self.crossed.maxlen and self.crossed[0]:
+                self.ncrossings -= 1
+            self.crossed.append(crossing)
+            if crossing:
+                self.ncrossings += 1
+            if self.ncrossings >= self.crossings and not self.warned:
+                self.warned = True
+                anomalies.append(self.__raise__("oscillation", None,
+                    "the actual temperature crossed the setpoint band %s times in %s readings"%(self.ncrossings, len(self.crossed))))
+
+        return anomalies
+
+    #******************************************
+    def callback(self, event, **fields):
+        """Process climatechambercontroller.cycle events and return the action to take."""
+
+        if event == "step":
+            self.reset(dwelling=False, target=fields["setpoint"])
+        elif event == "dwell" and not self.dwelling:
+            self.reset(dwelling=True)
+        elif event == "reading":
+            actions = [found.action for found in self.update(fields["actual"], fields["setpoint"], fields.get("status"))]
+            for action in [climatechambercontroller.ABORT, climatechambercontroller.PAUSE]:
+                if action in actions:
+                    return action
+
+        return None
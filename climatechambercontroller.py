@@ -12,17 +12,198 @@ __version__ = "0.0.0"
 DELIM = b"\xb6"
 CR = b"\r"
 
+#******************************************
+#connection timeout [s]
+TIMEOUT = 10.0
+
+#setpoint resolution of ramp-rate-limited profiles [C]
+RESOLUTION = 0.1
+
+#program callback actions
+#PAUSE holds the ramp and stops the dwell time from running, ABORT stops the program
+#RELEASE stops the program leaving the climate chamber as it is (e.g. when it has been taken over by another host)
+PAUSE = "pause"
+ABORT = "abort"
+RELEASE = "release"
+
+#control variables
+#NOTE which control variables are available depends on the climate chamber
+TEMPERATURE = 1
+HUMIDITY = 2
+VARIABLES = {TEMPERATURE: ("temperature", "C"), HUMIDITY: ("humidity", "%")}
+
+#number of digital channels read at once
+#NOTE channel n is bit n - 1 of the channel bitmask
+CHANNELS = 8
+
+#delay before reading back digital channels again when they do not match yet [s]
+#NOTE some climate chambers apply channel changes asynchronously
+SETTLE = 0.2
+
 #******************************************
 #import stuff
+#NOTE numpy is only imported where needed, so that single commands start fast
 import socket, sys, logging, time
+from collections import namedtuple
+from contextlib import contextmanager
+
+#******************************************
+#SIMSERV command IDs
+STATUS = "10012"
+SET_NOMINAL = "11001"
+GET_NOMINAL = "11002"
+GET_ACTUAL = "11004"
+SET_CHANNEL = "14001"
+GET_CHANNEL = "14003"
+
+#******************************************
+#SIMSERV command registry
+#args and returns list the argument and return value types
+#readonly commands do not change the climate chamber state and can be cached or coalesced
+#idempotent commands can be safely retried
+simservcommand = namedtuple("simservcommand", ["id", "name", "args", "returns", "readonly", "idempotent"])
+COMMANDS = {command.id: command for command in [
+    simservcommand(STATUS, "status", (("id", int),), (int,), True, True),
+    simservcommand(SET_NOMINAL, "set nominal value", (("variable", int), ("id", int), ("value", float)), (), False, True),
+    simservcommand(GET_NOMINAL, "get nominal value", (("variable", int), ("id", int)), (float,), True, True),
+    simservcommand(GET_ACTUAL, "get actual value", (("variable", int), ("id", int)), (float,), True, True),
+    simservcommand(SET_CHANNEL, "set digital channel", (("id", int), ("channel", int), ("value", int)), (), False, True),
+    simservcommand(GET_CHANNEL, "get digital channel", (("id", int), ("channel", int)), (int,), True, True),
+    ]}
+
+#******************************************
+#SIMSERV error codes
+ERRORS = {
+    "-1": "the receipt string was empty",
+    "-2": "missing chamber ID",
+    "-3": "chamber ID is in an invalid range",
+    "-4": "chamber not present",
+    "-5": "unknown command ID",
+    "-6": "too few or incorrect parameters",
+    "-7": "no server",
+    "-8": "control variables etc. with this ID not found",
+    "-9": "error while executing commands",
+    "-10": "index error while executing the command",
+    "-11": "no command execution possible because no user is logged in (with encrypted communication only)",
+    "-12": "the user logged in to the SIMSERV does not have command execution priviliges",
+    "-13": "duplicate login (the user is attempting to log in himself back into the open session)",
+    }
+
+#******************************************
+def validate(arglist):
+    """Validate a SIMSERV command against the registry.
+
+    Return an error message, or None if the command is valid or not in the registry.
+    """
+
+    command = COMMANDS.get(arglist[0])
+    if command is None:
+        return None
+
+    #number of arguments
+    if len(arglist) - 1 != len(command.args):
+        return "%s expects %s arguments (%s), got %s"%(
+            command.name,
+            len(command.args),
+            ", ".join(name for name, _ in command.args),
+            len(arglist) - 1)
+
+    #argument types
+    for (name, argtype), arg in zip(command.args, arglist[1:]):
+        try:
+            argtype(arg)
+        except ValueError:
+            return "%s: invalid %s (%s)"%(command.name, name, arg)
+
+    return None
+
+#******************************************
+def parse(arglist, output):
+    """Convert the values returned by a SIMSERV command to the types in the registry."""
+
+    command = COMMANDS.get(arglist[0])
+    if command is None or output[0] != "1":
+        return output[1:]
+
+    return [returntype(value) for returntype, value in zip(command.returns, output[1:])]
+
+#******************************************
+def idempotent(arglist):
+    """Whether a SIMSERV command can be safely resent.
+
+    NOTE commands that are not in the registry are assumed not to be.
+    """
+
+    command = COMMANDS.get(arglist[0])
+
+    return command is not None and command.idempotent
+
+#******************************************
+def rampProfile(start, target, rate, refresh=2.0, resolution=RESOLUTION):
+    """Precompute a ramp-rate-limited setpoint trajectory.
+
+    The setpoint moves linearly from start to target at the given rate [C/minute] and is sampled every refresh interval [s].
+    It is quantized to the given resolution [C] and only the points where the quantized setpoint changes are kept.
+    Return a list of (time [s], setpoint [C]) pairs, starting at time 0 and ending at the target.
+    """
+
+    if refresh <= 0:
+        raise ValueError("the refresh interval must be positive (%s s)"%refresh)
+
+    #------------------------------------------
+    #quantize
+    def quantize(value):
+        return round(round(value/resolution)*resolution, 6)
+
+    #------------------------------------------
+    #trajectory
+    profile = [(0., quantize(start))]
+    distance = abs(target - start)
+    sign = 1. if target >= start else -1.
+    duration = 60.*distance/rate if rate > 0 else 0.
+
+    ii = 1
+    while ii*refresh < duration:
+        setpoint = quantize(start + sign*rate*ii*refresh/60.)
+        if setpoint != profile[-1][1]:
+            profile.append((ii*refresh, setpoint))
+        ii += 1
+
+    #end exactly at the target
+    if profile[-1][1] != target:
+        profile.append((ii*refresh if duration > 0 else 0., target))
+
+    return profile
+
+#******************************************
+def chain(*callbacks):
+    """Combine several program callbacks into one.
+
+    The combined callback returns the most severe of the actions returned by the callbacks.
+    """
+
+    def callback(event, **fields):
+        actions = [function(event, **fields) for function in callbacks if function is not None]
+        for action in [RELEASE, ABORT, PAUSE]:
+            if action in actions:
+                return action
+        return None
+
+    return callback
 
 #******************************************
 class climatechambercontroller:
     """Climate Chamber Controller is a module designed to communicate with Voetsch and Weisstechnik climate chambers using SIMSERV."""
 
     #******************************************
-    def __init__(self, address, port, id):
-        """Initialize climate chamber controller."""
+    def __init__(self, address, port, id, trace=None, persistent=False, scheduler=None, clock=None):
+        """Initialize climate chamber controller.
+
+        An optional simservtrace.tracer records every exchange.
+        In persistent mode the connection is kept open between commands until close() is called.
+        An optional scheduler.scheduler sends the commands on behalf of this controller.
+        An optional clock providing time() and sleep() replaces the time module (e.g. simulation.virtualclock).
+        """
 
         #set address, port and ID
         self.address = address
@@ -31,6 +212,25 @@ class climatechambercontroller:
 
         #create stream socket
         self.client = None
+        self.buffer = b""
+        self.persistent = persistent
+
+        #trace
+        self.trace = trace
+
+        #scheduler
+        self.scheduler = scheduler
+
+        #program event callback
+        self.callback = None
+        self.released = False
+
+        #digital channels switched by the running program
+        self.switched = {}
+
+        #clock
+        self.clock = clock if clock is not None else time
+        self.chamber = "%s:%s/%s"%(address, port, id)
         
         return
 
@@ -46,6 +246,26 @@ class climatechambercontroller:
 
         return
 
+    #******************************************
+    def close(self):
+        """Close the connection to the climate chamber."""
+
+        if self.client is not None:
+            self.client.close()
+            self.client = None
+        self.buffer = b""
+
+        return
+
+    #******************************************
+    def __enter__(self):
+        return self
+
+    #******************************************
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
     #******************************************
     def encode(self, arglist):
         """Create SIMSERV command string."""
@@ -64,114 +284,216 @@ class climatechambercontroller:
     #******************************************
     def send(self, arglist, verbose=False, force=False):
         """Send command."""
+        return self.sendBatch([arglist], verbose)[0]
+
+    #******************************************
+    def sendBatch(self, arglists, verbose=False):
+        """Send several commands over a single connection.
+
+        The commands are pipelined: they are all sent before the responses are read.
+        Return the list of outputs, in the same order as the commands.
+        """
+
+        #scheduled commands
+        if self.scheduler is not None:
+            futures = [self.scheduler.submit(arglist, verbose) for arglist in arglists]
+            return [future.result() for future in futures]
     
-        #connect
-        self.client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.connect(verbose)
+        #start time
+        timestamp = self.clock.time()
+        start = time.perf_counter()
 
+        #------------------------------------------
+        #validate commands
+        outputs = [None]*len(arglists)
+        indices = []
+        for ii, arglist in enumerate(arglists):
+            error = validate(arglist)
+            if error is not None:
+                logging.error(error)
+                outputs[ii] = ["-6"]
+            else:
+                indices.append(ii)
+
+        if len(indices) == 0:
+            return outputs
+
+        #------------------------------------------
         #encode command string
-        commandstring = self.encode(arglist)
+        commandstring = b"".join(self.encode(arglists[ii]) for ii in indices)
 
         #send command
         if verbose:
-            logging.info("sending: %s"%" ".join(self.decode(commandstring)))
-        self.client.send(commandstring)
+            for ii in indices:
+                logging.info("sending: %s"%" ".join(self.decode(self.encode(arglists[ii]))))
+
+        #persistent connection
+        #NOTE the connection may have been closed by the climate chamber in the meantime: reconnect once
+        #NOTE only idempotent commands are resent, the others may have been executed already
+        data = []
+        if self.persistent and self.client is not None:
+            try:
+                self.client.sendall(commandstring)
+                data = [self.__receive__() for ii in indices]
+            except OSError:
+                data = []
+            if b"" in data or len(data) == 0:
+                self.close()
+                if not all(idempotent(arglists[ii]) for ii in indices):
+                    logging.error("the connection to the climate chamber was lost, will not resend the commands")
+                    for ii in indices:
+                        outputs[ii] = ["0"]
+                    return outputs
+
+        #new connection
+        if self.client is None:
+            self.client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.connect(verbose)
+
+            #NOTE responses are read until a carriage return: never wait forever for it
+            self.client.settimeout(TIMEOUT)
+            self.client.sendall(commandstring)
+
+            #get data
+            data = [self.__receive__() for ii in indices]
+            if not self.persistent:
+                self.close()
 
-        #get data
-        data = self.client.recv(512)
-        self.client.close()
-        output = self.decode(data)
+        #------------------------------------------
+        #decode
+        latency = time.perf_counter() - start
+        for ii, datum in zip(indices, data):
+            output = self.decode(datum)
+            outputs[ii] = output
 
-        #verbose
-        if verbose:
-            logging.info("received: %s"%" ".join(output))
+            #trace
+            if self.trace is not None:
+                self.trace.record(self.chamber, timestamp, latency, arglists[ii], output)
 
-        #check for errors
-        if output[0] != "1":
-            if output[0] == "-1":
-                logging.error("the receipt string was empty")
-            elif output[0] == "-2":
-                logging.error("missing chamber ID")
-            elif output[0] == "-3":
-                logging.error("chamber ID is in an invalid range")
-            elif output[0] == "-4":
-                logging.error("chamber not present")
-            elif output[0] == "-5":
-                logging.error("unknown command ID")
-            elif output[0] == "-6":
-                logging.error("too few or incorrect parameters")
-            elif output[0] == "-7":
-                logging.error("no server")
-            elif output[0] == "-8":
-                logging.error("control variables etc. with this ID not found")
-            elif output[0] == "-9":
-                logging.error("error while executing commands")
-            elif output[0] == "-10":
-                logging.error("index error while executing the command")
-            elif output[0] == "-11":
-                logging.error("no command execution possible because no user is logged in (with encrypted communication only)")
-            elif output[0] == "-12":
-                logging.error("the user logged in to the SIMSERV does not have command execution priviliges")
-            elif output[0] == "-13":
-                logging.error("duplicate login (the user is attempting to log in himself back into the open session)")
-            else:
-                logging.error("undefined error")
+            #verbose
+            if verbose:
+                logging.info("received: %s"%" ".join(output))
+
+            #check for errors
+            if output[0] != "1":
+                logging.error(ERRORS.get(output[0], "undefined error"))
 
-        return output
+        return outputs
+
+    #******************************************
+    def __receive__(self):
+        """Receive a complete response."""
+        #NOTE responses are terminated by a carriage return
+        #NOTE any data following it belongs to the next response
+
+        while CR not in self.buffer:
+            chunk = self.client.recv(512)
+            if not chunk:
+                data, self.buffer = self.buffer, b""
+                return data
+            self.buffer += chunk
+
+        data, self.buffer = self.buffer.split(CR, 1)
+
+        return data
+
+    #******************************************
+    @contextmanager
+    def session(self):
+        """Keep a single connection open for the commands within the block."""
+
+        persistent = self.persistent
+        self.persistent = True
+        try:
+            yield self
+        finally:
+            self.persistent = persistent
+            if not persistent:
+                self.close()
 
     #******************************************
     def isAvailable(self, verbose=False):
         """Check climate chamber availability."""
-        return True if self.send(["10012", str(self.id)], verbose)[1] == "1" else False
+        return True if self.send([STATUS, str(self.id)], verbose)[1] == "1" else False
     
     #******************************************
     def stop(self, verbose=False):
         """Stop climate chamber."""
         #NOTE this is the same as setting digital channel 1 to 0 (off)
-        return self.send(["14001", str(self.id), "1", "0"], verbose)
+        return self.send([SET_CHANNEL, str(self.id), "1", "0"], verbose)
 
     #******************************************
     def getStatus(self, verbose=False):
         """Get climate chamber status."""
-        return self.send(["10012", str(self.id)], verbose)
+        return self.send([STATUS, str(self.id)], verbose)
 
     #******************************************
-    def getActualTemperature(self, verbose=False):
-        """Get climate chamber actual temperature."""
-        #NOTE apperently an additional argument is needed before the ID
-        return self.send(["11004", "1", str(self.id)], verbose)
+    def getActualValue(self, variable, verbose=False):
+        """Get climate chamber actual value of a control variable."""
+        return self.send([GET_ACTUAL, str(variable), str(self.id)], verbose)
 
     #******************************************
-    def getNominalTemperature(self, verbose=False):
-        """Get climate chamber nominal temperature."""
-        #NOTE apperently an additional argument is needed before the ID
-        return self.send(["11002", "1", str(self.id)], verbose)
+    def getNominalValue(self, variable, verbose=False):
+        """Get climate chamber nominal value of a control variable."""
+        return self.send([GET_NOMINAL, str(variable), str(self.id)], verbose)
 
     #******************************************
-    def setNominalTemperature(self, temperature, verbose=False, force=False):
-        """Set climate chamber nominal temperature."""
-        #NOTE apperently an additional argument is needed before the ID
+    def readValues(self, variables=(TEMPERATURE,), verbose=False):
+        """Read the actual and nominal values of several control variables in a single batch.
+
+        Return an array with the actual values in the first row and the nominal values in the second one (NaN if a value could not be read).
+        """
+
+        import numpy as np
+
+        arglists = [[GET_ACTUAL, str(variable), str(self.id)] for variable in variables] + [[GET_NOMINAL, str(variable), str(self.id)] for variable in variables]
+        outputs = self.sendBatch(arglists, verbose)
+
+        return np.array([parse(arglist, output)[0] if output[0] == "1" else np.nan for arglist, output in zip(arglists, outputs)]).reshape(2, len(variables))
+
+    #******************************************
+    def setNominalValue(self, variable, value, verbose=False, force=False):
+        """Set climate chamber nominal value of a control variable."""
 
         #------------------------------------------
         #check whether the climate chamber is available
         if not self.isAvailable():
             logging.warning("the climate chamber is currently busy")
+            name = VARIABLES[variable][0] if variable in VARIABLES else "control variable %s"%variable
             
             #force
             if force:
-                logging.warning("forcing temperature setting")
+                logging.warning("forcing %s setting"%name)
                 self.stop(verbose)
             else:
-                logging.warning("will not set temperature")
+                logging.warning("will not set %s"%name)
                 return ["0"]
         
-        return self.send(["11001", "1", str(self.id), str(temperature)], verbose)
+        return self.send([SET_NOMINAL, str(variable), str(self.id), str(value)], verbose)
+
+    #******************************************
+    def getActualTemperature(self, verbose=False):
+        """Get climate chamber actual temperature."""
+        #NOTE apperently an additional argument is needed before the ID
+        return self.getActualValue(TEMPERATURE, verbose)
+
+    #******************************************
+    def getNominalTemperature(self, verbose=False):
+        """Get climate chamber nominal temperature."""
+        #NOTE apperently an additional argument is needed before the ID
+        return self.getNominalValue(TEMPERATURE, verbose)
+
+    #******************************************
+    def setNominalTemperature(self, temperature, verbose=False, force=False):
+        """Set climate chamber nominal temperature."""
+        #NOTE apperently an additional argument is needed before the ID
+        return self.setNominalValue(TEMPERATURE, temperature, verbose, force)
 
     #******************************************
     def getChannel(self, channel, verbose=False):
         """Get digital channel status."""
         #NOTE channel 1 is the climate chamber status (on/off)
-        return self.send(["14003", str(self.id), str(channel)], verbose)
+        return self.send([GET_CHANNEL, str(self.id), str(channel)], verbose)
 
     #******************************************
     def setChannel(self, channel, value, verbose=False, force=False):
@@ -190,7 +512,69 @@ class climatechambercontroller:
                 logging.warning("will not set channel")
                 return ["0"]
         
-        return self.send(["14001", str(self.id), str(channel), str(value)], verbose)
+        return self.send([SET_CHANNEL, str(self.id), str(channel), str(value)], verbose)
+
+    #******************************************
+    def readChannels(self, channels=None, verbose=False):
+        """Read several digital channels (by default the first CHANNELS) in a single batch.
+
+        Return the channel states as a bitmask (channel n is bit n - 1), or None if a channel could not be read.
+        """
+
+        channels = channels if channels is not None else range(1, CHANNELS + 1)
+        arglists = [[GET_CHANNEL, str(self.id), str(channel)] for channel in channels]
+        outputs = self.sendBatch(arglists, verbose)
+
+        mask = 0
+        for channel, arglist, output in zip(channels, arglists, outputs):
+            if output[0] != "1":
+                logging.error("there was an error reading channel %s: %s"%(channel, " ".join(output)))
+                return None
+            if parse(arglist, output)[0]:
+                mask |= 1 << (int(channel) - 1)
+
+        return mask
+
+    #******************************************
+    def writeChannels(self, channels, verbose=False, force=False):
+        """Set several digital channels, given as {channel: value}, in a single batch and verify them.
+
+        The channels are read back in the same batch, right after being set, and once more after SETTLE seconds if they do not match yet.
+        Return ["1", bitmask of the channels read back] if all channels were set, an error output otherwise.
+        """
+
+        #------------------------------------------
+        #check whether the climate chamber is available
+        #NOTE the check is skipped when forcing, it would not change anything
+        if not force and not self.isAvailable():
+            logging.warning("the climate chamber is currently busy")
+            logging.warning("will not set channels")
+            return ["0"]
+
+        #------------------------------------------
+        #set and read back
+        arglists = [[SET_CHANNEL, str(self.id), str(channel), str(int(value))] for channel, value in channels.items()] + [[GET_CHANNEL, str(self.id), str(channel)] for channel in channels]
+        outputs = self.sendBatch(arglists, verbose)
+        for output in outputs:
+            if output[0] != "1":
+                return output
+
+        #------------------------------------------
+        #verify
+        mask, expected = 0, 0
+        for (channel, value), arglist, output in zip(channels.items(), arglists[len(channels):], outputs[len(channels):]):
+            mask |= (1 if parse(arglist, output)[0] else 0) << (int(channel) - 1)
+            expected |= (1 if int(value) else 0) << (int(channel) - 1)
+        if mask != expected:
+            self.clock.sleep(SETTLE)
+            mask = self.readChannels(list(channels), verbose)
+            if mask is None:
+                return ["0"]
+        if mask != expected:
+            logging.warning("channels not set: expected %s, read back %s"%(bin(expected), bin(mask)))
+            return ["0", str(mask)]
+
+        return ["1", str(mask)]
 
     #******************************************
     def start(self, verbose=False, force=False):
@@ -210,40 +594,191 @@ class climatechambercontroller:
                 logging.warning("will not start")
                 return ["0"]
 
-        return self.send(["14001", str(self.id), "1", "1",], verbose)
+        return self.send([SET_CHANNEL, str(self.id), "1", "1",], verbose)
+
+    #******************************************
+    def __ramp__(self, temp, rate, refresh=2.0, verbose=False):
+        """Ramp the nominal temperature at a limited rate [C/minute].
+
+        The setpoint trajectory is precomputed and the nominal temperature is only written when the quantized setpoint changes.
+        Each write is sent together with an actual temperature reading.
+        The trajectory is held while the callback returns PAUSE.
+        """
+
+        #------------------------------------------
+        #trajectory from the actual temperature
+        profile = rampProfile(float(self.getActualTemperature()[1]), temp, rate, refresh)
+        if verbose:
+            logging.info("ramping at %.2f C/minute: %s setpoints over %.0f s"%(rate, len(profile), profile[-1][0]))
+
+        #------------------------------------------
+        #start from the actual temperature
+        self.setNominalTemperature(profile[0][1], verbose, force = True)
+        self.start(verbose, force = True)
+
+        #------------------------------------------
+        #follow the trajectory
+        start = self.clock.time()
+        for t, setpoint in profile[1:]:
+            self.clock.sleep(max(0., start + t - self.clock.time()))
+            arglists = [
+                [SET_NOMINAL, str(TEMPERATURE), str(self.id), str(setpoint)],
+                [GET_ACTUAL, str(TEMPERATURE), str(self.id)]] + ([[STATUS, str(self.id)]] if self.callback is not None else [])
+            output = self.sendBatch(arglists, verbose)
+            if verbose:
+                logging.info("setpoint %.2f C, actual %s C"%(setpoint, output[1][-1]))
+            if output[1][0] == "1" and self.callback is not None:
+                action = self.__report__("reading", actual=parse(arglists[1], output[1])[0], setpoint=setpoint, status=parse(arglists[2], output[2])[0] if output[2][0] == "1" else None)
+
+                #NOTE the rest of the trajectory is delayed by the time spent paused
+                while action == PAUSE:
+                    paused = self.clock.time()
+                    self.clock.sleep(refresh)
+                    _, action = self.__poll__([TEMPERATURE], [setpoint])
+                    start += self.clock.time() - paused
+
+        return
+
+    #******************************************
+    def __report__(self, event, **fields):
+        """Report a program event to the callback, if any.
+
+        Return the action requested by the callback; the program is aborted right away if it is ABORT or RELEASE.
+        """
+
+        if self.callback is None:
+            return None
+
+        action = self.callback(event, **fields)
+        if action == ABORT:
+            raise RuntimeError("program aborted")
+        elif action == RELEASE:
+            self.released = True
+            raise RuntimeError("program released")
+
+        return action
 
     #******************************************
-    def __rampAndDwell__(self, temp, interval, tolerance=0.1, refresh=2.0, verbose=False):
+    def __poll__(self, variables, setpoints):
+        """Read the actual values of the control variables (temperature first) in a single batch.
+
+        If someone is listening, the status is read as well (over the same connection) and both are reported (the status as None if it could not be read).
+        Return the actual values as an array and the action requested by the callback.
+        """
+
+        import numpy as np
+
+        arglists = [[GET_ACTUAL, str(variable), str(self.id)] for variable in variables] + ([[STATUS, str(self.id)]] if self.callback is not None else [])
+        outputs = self.sendBatch(arglists)
+        actuals = np.array([parse(arglist, output)[0] for arglist, output in zip(arglists, outputs[:len(variables)])], dtype=float)
+
+        if self.callback is None:
+            return actuals, None
+
+        #NOTE the other control variables are only reported when there are any
+        fields = {}
+        if len(variables) > 1:
+            fields = {"variables": list(variables), "actuals": actuals.tolist(), "setpoints": list(setpoints)}
+        action = self.__report__("reading", actual=float(actuals[0]), setpoint=setpoints[0], status=parse(arglists[-1], outputs[-1])[0] if outputs[-1][0] == "1" else None, **fields)
+
+        return actuals, action
+
+    #******************************************
+    def __rampAndDwell__(self, temp, interval, tolerance=0.1, refresh=2.0, verbose=False, rate=0., targets=None, channels=None):
         """Ramp to a temperature and dwell for a given interval.
 
         NOTE The time interval is measured in minutes.
+        NOTE The ramp rate is measured in C/minute; 0 lets the climate chamber ramp at its own rate.
+        NOTE The optional targets of the other control variables are given as {variable: (value, tolerance)}.
+        NOTE The optional digital channels to switch (e.g. dry air) are given as {channel: value}.
         """
+
+        import numpy as np
+
+        #------------------------------------------
+        #digital channels
+        #NOTE only the channels whose state changes are written
+        channels = {channel: value for channel, value in (channels or {}).items() if self.switched.get(channel) != value}
+        if len(channels) > 0:
+            output = self.writeChannels(channels, verbose, force = True)
+            if output[0] == "1":
+                self.switched.update(channels)
+            else:
+                logging.warning("there was an error setting the channels: %s"%" ".join(output))
+
+        #------------------------------------------
+        #control variables
+        targets = targets if targets is not None else {}
+        variables = [TEMPERATURE] + list(targets)
+        setpoints = np.array([temp] + [value for value, _ in targets.values()], dtype=float)
+        tolerances = np.array([tolerance] + [tolerance for _, tolerance in targets.values()], dtype=float)
+
+        #set the other control variables right away
+        #NOTE the ramp rate only applies to the temperature
+        if len(targets) > 0:
+            if verbose:
+                logging.info("setting %s"%", ".join("%s to %.2f"%(VARIABLES[variable][0] if variable in VARIABLES else variable, value) for variable, (value, _) in targets.items()))
+            outputs = self.sendBatch([[SET_NOMINAL, str(variable), str(self.id), str(value)] for variable, (value, _) in targets.items()], verbose)
+            for variable, output in zip(targets, outputs):
+                if output[0] != "1":
+                    logging.warning("there was an error setting the %s: %s"%(VARIABLES[variable][0] if variable in VARIABLES else "control variable %s"%variable, " ".join(output)))
         
         #ramp to temperature
         if verbose:
             logging.info("ramping to %.2f C"%temp)
-        self.setNominalTemperature(temp, verbose, force = True)
-        self.start(verbose, force = True)
+        if rate > 0:
+            self.__ramp__(temp, rate, refresh, verbose)
+        else:
+            self.setNominalTemperature(temp, verbose, force = True)
+            self.start(verbose, force = True)
     
-        #wait until temperature is reached (within tolerance)
-        while abs( float(self.getActualTemperature()[1]) - temp) > tolerance:
-            time.sleep(refresh)
+        #wait until temperature (and the other control variables) are reached (within tolerance)
+        #NOTE the step is not reached while paused
+        while True:
+            actuals, action = self.__poll__(variables, setpoints)
+            if action != PAUSE and np.all(np.abs(actuals - setpoints) <= tolerances):
+                break
+            self.clock.sleep(refresh)
 
         #dwell
         if verbose:
             logging.info("reached %.2f C"%float(self.getActualTemperature()[1]))
             logging.info("dwelling for %.0f\'"%interval)
-        time.sleep(interval*60)
+        deadline = self.clock.time() + interval*60
+        self.__report__("dwell", deadline=deadline)
+
+        #NOTE readings are only taken while dwelling if someone is listening
+        if self.callback is None:
+            self.clock.sleep(interval*60)
+        else:
+            last = self.clock.time()
+            while self.clock.time() < deadline:
+                self.clock.sleep(max(0., min(refresh, deadline - self.clock.time())))
+                actuals, action = self.__poll__(variables, setpoints)
+
+                #NOTE the dwell time does not run while paused
+                now = self.clock.time()
+                if action == PAUSE:
+                    deadline += now - last
+                    self.__report__("dwell", deadline=deadline)
+                last = now
 
         return
 
     #******************************************
-    def cycle(self, arglist, tolerance=0.1, refresh=2.0, verbose=False, force=False):
+    def cycle(self, arglist, tolerance=0.1, refresh=2.0, verbose=False, force=False, rate=0., callback=None, variables=None, dryair=None):
         """Thermal cycle.
 
         Thermal cycling is controlled entirely through this Python module.
         While the climate chamber itself may have the ability to run programs, this functionality is not used here.
         No programs are saved to nor loaded from the climate chamber.
+        An optional ramp rate [C/minute] limits how fast the nominal temperature moves between steps.
+        An optional callback is called as callback(event, **fields) with the program, step, reading, dwell and end events.
+        The callback can return PAUSE to hold the ramp, the step and the dwell time, ABORT to stop the program or RELEASE to stop the program without stopping the climate chamber.
+        Other control variables (e.g. humidity) can be set at each step as {variable: (value 1, value 2, value 3, tolerance)};
+        a step is reached when all control variables are within their tolerances.
+        Dry air can be switched on at the cold steps and off at the others as (channel, temperature below which dry air is on [C]).
+        Return ["1"] if the program was completed, ["0"] if it was not started or interrupted.
         """
 
         #------------------------------------------
@@ -269,109 +804,88 @@ class climatechambercontroller:
         temp3 = int(arglist[5])
         interval3 = int(arglist[6])
 
+        #other control variables at each step
+        variables = variables if variables is not None else {}
+        targets1 = {variable: (float(values[0]), float(values[3])) for variable, values in variables.items()}
+        targets2 = {variable: (float(values[1]), float(values[3])) for variable, values in variables.items()}
+        targets3 = {variable: (float(values[2]), float(values[3])) for variable, values in variables.items()}
+
+        #dry air at each step
+        channels1, channels2, channels3 = None, None, None
+        if dryair is not None:
+            dryair = (int(dryair[0]), float(dryair[1]))
+            channels1, channels2, channels3 = [{dryair[0]: int(temp < dryair[1])} for temp in [temp1, temp2, temp3]]
+
         logging.info("thermal cycling")
         logging.info("tolerance: %.2f C"%tolerance)
+        if dryair is not None:
+            logging.info("dry air (channel %s) below %.2f C"%dryair)
+        if rate > 0:
+            logging.info("ramp rate: %.2f C/minute"%rate)
+        for variable, values in variables.items():
+            name, unit = VARIABLES[variable] if variable in VARIABLES else ("control variable %s"%variable, "")
+            logging.info("%s: %s, %s, %s (tolerance: %s) %s"%(name, values[0], values[1], values[2], values[3], unit))
 
         #------------------------------------------
         #thermal cycle
+        self.callback = callback
+        self.released = False
+        self.switched = {}
+        self.__report__("program", ncycles=ncycles)
+        interrupted = False
         try:
 
-            #cycle
-            for ii in range(ncycles):
-                
-                logging.info("cycle %s"%ii)
-
-                #step 1
-                if interval1 > 0:
-                    self.__rampAndDwell__(temp1, interval1, tolerance, refresh, verbose)
-
-                #step 2
-                if interval2 > 0:
-                    self.__rampAndDwell__(temp2, interval2, tolerance, refresh, verbose)
-
-            #final step
-            if interval3 > 0:
-                logging.info("final step")
-                self.__rampAndDwell__(temp3, interval3, tolerance, refresh, verbose)
+            #NOTE a single connection is used for the whole program
+            with self.session():
+
+                #cycle
+                for ii in range(ncycles):
+                    
+                    logging.info("cycle %s"%ii)
+
+                    #step 1
+                    if interval1 > 0:
+                        self.__report__("step", cycle=ii, step=1, setpoint=temp1)
+                        self.__rampAndDwell__(temp1, interval1, tolerance, refresh, verbose, rate, targets1, channels1)
+
+                    #step 2
+                    if interval2 > 0:
+                        self.__report__("step", cycle=ii, step=2, setpoint=temp2)
+                        self.__rampAndDwell__(temp2, interval2, tolerance, refresh, verbose, rate, targets2, channels2)
+
+                #final step
+                if interval3 > 0:
+                    logging.info("final step")
+                    self.__report__("step", cycle=ncycles, step=3, setpoint=temp3)
+                    self.__rampAndDwell__(temp3, interval3, tolerance, refresh, verbose, rate, targets3, channels3)
             
         except: #KeyboardInterrupt:
             logging.warning("thermal cycling interrupted")
-            logging.warning("stopping climate chamber")
-            self.stop(verbose)
+            interrupted = True
+            if not self.released:
+                logging.warning("stopping climate chamber")
+                self.stop(verbose)
+
+        finally:
+            self.__report__("end", interrupted=interrupted)
+            self.callback = None
 
         #------------------------------------------
         #finally stop
+        #NOTE a released climate chamber is left to its new owner
+        if self.released:
+            logging.warning("leaving the climate chamber as it is")
+            return ["0"]
         self.stop(verbose)
     
-        return
+        return ["0"] if interrupted else ["1"]
 
 #******************************************
-if __name__ == "__main__":
-
-    #------------------------------------------
-    #import stuff
-    import argparse
-
-    #------------------------------------------
-    #logging setup
-    logging.basicConfig(format="%(levelname)s %(message)s", level=logging.INFO)
-
-    #------------------------------------------
-    #input arguments
-    parser = argparse.ArgumentParser(description="%prog [options]")
-
-    #configuration
-    parser.add_argument("-a", "--address", dest="address", type=str, required=True, help="climate chamber address")
-    parser.add_argument("-p", "--port", dest="port", type=int, required=False, default=2049, help="climate chamber port")
-    parser.add_argument("-i", "--id", dest="id", type=int, required=False, default=1, help="climate chamber ID")
-    parser.add_argument("-t", "--tolerance", dest="tolerance", type=float, required=False, default=0.1, help="temperature tolerance [C]")
-    parser.add_argument("-r", "--refresh", dest="refresh", type=float, required=False, default=2.0, help="refresh interval [s]")
-    
-    #other
-    parser.add_argument("-v", "--verbose", dest="verbose", action="store_true", default=False, help="verbose mode")
-    parser.add_argument("-f", "--force", dest="force", action="store_true", default=False, help="force command")
-
-    #------------------------------------------
-    #mutually excusive commands
-    command_parser = parser.add_mutually_exclusive_group(required=True)
-
-    #status (default): --status
-    command_parser.add_argument("--status", "-s", dest="status", action="store_true", default=False, help="get status")
-
-    #get temperature (actual and nominal): --gettemp
-    command_parser.add_argument("--gettemp", dest="gettemp", action="store_true", default=False, help="get actual and nominal temperatures [C]")
-
-    #set nominal temperature and start: --settemp <temperature>
-    command_parser.add_argument("--settemp", dest="temp", type=float, default=None, help="set nominal temperature and start [C]")
-
-    #get digital channel status
-    command_parser.add_argument("--getchannel", dest="getchannel", type=int, default=None, help="get channel status")
-
-    #set digital channel status
-    command_parser.add_argument("--setchannel", dest="setchannel", nargs=2, default=None, help="set channel status: <channel> <status>")
-    
-    #start: --start
-    command_parser.add_argument("--start", dest="start", action="store_true", default=False, help="start")
+def execute(ccc, args):
+    """Execute a command-line command and print its output.
 
-    #stop: --stop
-    command_parser.add_argument("--stop", dest="stop", action="store_true", default=False, help="stop")
-
-    #custom command: --command <values>
-    command_parser.add_argument("--command", "-c", dest="command", nargs="+", default=None, help="custom command: command, ID, arguments")
-
-    #cycle: --cycle <n> <t1> <i1> <t2> <i2> <t3> <i3>
-    command_parser.add_argument("--cycle", dest="cycle", nargs=7, default=None, help="thermal cylcing: n, t1 [C], i1 ['], t2 [C], i2 ['], t3 [C], i3 [']")
-        
-    #------------------------------------------
-    #parse input arguments
-    args = parser.parse_args()
-    
-    #------------------------------------------
-    #create climate chamber controller instance
-    ccc = climatechambercontroller(args.address, args.port, args.id)
-
-    #------------------------------------------
-    #run
+    Return whether the command was successful.
+    """
 
     #stop
     if args.stop:
@@ -381,6 +895,7 @@ if __name__ == "__main__":
             print("climate chamber stopped")
         else:
             logging.error("there was an error: %s"%" ".join(output))
+            return False
     
     #status
     elif args.status:
@@ -404,6 +919,13 @@ if __name__ == "__main__":
         print("actual temperature:  %.2f C"%float(ccc.getActualTemperature(args.verbose)[1]))
         print("nominal temperature: %.2f C"%float(ccc.getNominalTemperature(args.verbose)[1]))
 
+    #get actual and nominal values of several control variables
+    elif args.getvalues:
+        values = ccc.readValues(args.variables, args.verbose)
+        for ii, variable in enumerate(args.variables):
+            name, unit = VARIABLES[variable] if variable in VARIABLES else ("control variable %s"%variable, "")
+            print("%s: actual %.2f %s, nominal %.2f %s"%(name, values[0, ii], unit, values[1, ii], unit))
+
     #set nominal temperature and start
     elif args.temp is not None:
 
@@ -414,7 +936,7 @@ if __name__ == "__main__":
             print("nominal temperature set")
         else:
             logging.error("there was an error: %s"%" ".join(output))
-            sys.exit(1)
+            return False
 
         #start
         output = ccc.start(args.verbose, args.force)
@@ -423,6 +945,7 @@ if __name__ == "__main__":
             print("climate chamber started")
         else:
             logging.error("there was an error: %s"%" ".join(output))
+            return False
 
     #get channel status
     elif args.getchannel is not None:
@@ -432,6 +955,7 @@ if __name__ == "__main__":
             print("channel status: %s"%output[1])
         else:
             logging.error("there was an error: %s"%" ".join(output))
+            return False
 
     #set channel status
     elif args.setchannel is not None:
@@ -441,6 +965,31 @@ if __name__ == "__main__":
             print("channel set")
         else:
             logging.error("there was an error: %s"%" ".join(output))
+            return False
+
+    #get the status of several channels
+    elif args.getchannels:
+        mask = ccc.readChannels(verbose=args.verbose)
+        if mask is None:
+            return False
+        print("channels: %s"%format(mask, "0%sb"%CHANNELS))
+        for channel in range(1, CHANNELS + 1):
+            print("channel %s: %s"%(channel, (mask >> (channel - 1)) & 1))
+
+    #set several channels
+    elif args.setchannels is not None:
+        try:
+            channels = {int(channel): int(value) for channel, value in (item.split("=") for item in args.setchannels)}
+        except ValueError:
+            logging.error("invalid channels: %s (expected <channel>=<status>)"%" ".join(args.setchannels))
+            return False
+        output = ccc.writeChannels(channels, args.verbose, args.force)
+
+        if output[0] == "1":
+            print("channels set")
+        else:
+            logging.error("there was an error: %s"%" ".join(output))
+            return False
 
     #start
     elif args.start:
@@ -450,6 +999,7 @@ if __name__ == "__main__":
             print("climate chamber started")
         else:
             logging.error("there was an error: %s"%" ".join(output))
+            return False
 
     #custom command
     elif args.command is not None:
@@ -457,6 +1007,7 @@ if __name__ == "__main__":
         #check number of arguments
         if len(args.command) < 2:
             logging.error("not enough arguments")
+            return False
         else:
             output = ccc.send(args.command, args.verbose, args.force)
 
@@ -465,7 +1016,299 @@ if __name__ == "__main__":
                 print("command output: %s"%" ".join(output))
             else:
                 logging.error("there was an error: %s"%" ".join(output))
+                return False
 
     #thermal cycling
     elif args.cycle is not None:
-        ccc.cycle(args.cycle, tolerance=args.tolerance, refresh=args.refresh, verbose=args.verbose, force=args.force)
+        callback = None
+        owner = None
+
+        #NOTE the lease is taken first: nothing else is opened if the climate chamber is leased by another host
+        if args.lease is not None:
+            import lease
+
+            #NOTE a single round trip either takes the lease or fails
+            owner = lease.lease(args.lease, ccc.address, ccc.port, ccc.id)
+            if not owner.acquire(args.force):
+                holder = owner.holder()
+                logging.error("the climate chamber is leased%s"%(" by %s until %s"%(holder[0], time.ctime(holder[1])) if holder is not None else ""))
+                owner.close()
+                return False
+            callback = owner.callback
+
+        if args.detect:
+            import anomaly
+            callback = chain(callback, anomaly.detector(args.tolerance, clock=ccc.clock).callback)
+        if args.history is not None:
+            import runhistory
+            callback = chain(callback, runhistory.recorder(
+                args.history,
+                ccc.chamber,
+                program=args.program,
+                parameters={"cycle": args.cycle, "tolerance": args.tolerance, "refresh": args.refresh, "rate": args.rate, "humidity": args.humidity, "dryair": args.dryair},
+                clock=ccc.clock).callback)
+        if args.archive is not None:
+            import telemetry
+            retention = args.retention if args.retention is not None else telemetry.RETENTION
+            callback = chain(callback, *[telemetry.archive(args.archive, ccc.chamber, variable, retention, ccc.clock).callback
+                for variable in [TEMPERATURE] + ([HUMIDITY] if args.humidity is not None else [])])
+        try:
+            output = ccc.cycle(args.cycle, tolerance=args.tolerance, refresh=args.refresh, verbose=args.verbose, force=args.force, rate=args.rate, callback=callback,
+                variables={HUMIDITY: args.humidity + [args.humiditytolerance]} if args.humidity is not None else None,
+                dryair=args.dryair)
+        finally:
+            if owner is not None:
+                owner.release()
+                owner.close()
+
+        if output[0] != "1":
+            logging.error("the thermal cycling was not completed")
+            return False
+
+    return True
+
+#******************************************
+def watch(ccc, interval, format="csv", count=0, verbose=False, variables=(TEMPERATURE,), archive=None, retention=None):
+    """Print the actual and nominal temperatures (and other control variables) at regular intervals.
+
+    Lines are printed as CSV or JSON; a count of 0 keeps going until interrupted.
+    All the values are read in a single batch.
+    The actual values can also be stored in a telemetry archive (see telemetry.archive), with an optional retention [days].
+    """
+
+    import numpy as np
+
+    #archive
+    archives = []
+    if archive is not None:
+        import telemetry
+        retention = retention if retention is not None else telemetry.RETENTION
+        archives = [telemetry.archive(archive, ccc.chamber, variable, retention) for variable in variables]
+
+    #NOTE the temperature columns keep their names, the other control variables are numbered
+    columns = []
+    for variable in variables:
+        columns += ["actual", "nominal"] if variable == TEMPERATURE else ["actual_%s"%variable, "nominal_%s"%variable]
+
+    #header
+    if format == "csv":
+        print(",".join(["time"] + columns), flush=True)
+    else:
+        import json
+
+    #poll
+    ii = 0
+    try:
+        while count <= 0 or ii < count:
+            start = time.time()
+            values = ccc.readValues(variables, verbose).T.ravel()
+            if format == "csv":
+                print(",".join(["%.3f"%start] + ["%.2f"%value for value in values]), flush=True)
+            else:
+                print(json.dumps({"time": round(start, 3), **dict(zip(columns, values.tolist()))}), flush=True)
+            for jj, series in enumerate(archives):
+                if not np.isnan(values[2*jj]):
+                    series.add(start, values[2*jj])
+
+            ii += 1
+            if count <= 0 or ii < count:
+                time.sleep(max(0., interval - (time.time() - start)))
+
+    except KeyboardInterrupt:
+        pass
+
+    finally:
+        for series in archives:
+            series.close()
+
+    return
+
+#******************************************
+def addCommands(parser):
+    """Add the mutually exclusive commands to a parser."""
+
+    #------------------------------------------
+    #mutually excusive commands
+    command_parser = parser.add_mutually_exclusive_group(required=True)
+
+    #status (default): --status
+    command_parser.add_argument("--status", "-s", dest="status", action="store_true", default=False, help="get status")
+
+    #get temperature (actual and nominal): --gettemp
+    command_parser.add_argument("--gettemp", dest="gettemp", action="store_true", default=False, help="get actual and nominal temperatures [C]")
+
+    #get actual and nominal values of several control variables: --getvalues
+    command_parser.add_argument("--getvalues", dest="getvalues", action="store_true", default=False, help="get actual and nominal values of the control variables (see --variables)")
+
+    #set nominal temperature and start: --settemp <temperature>
+    command_parser.add_argument("--settemp", dest="temp", type=float, default=None, help="set nominal temperature and start [C]")
+
+    #get digital channel status
+    command_parser.add_argument("--getchannel", dest="getchannel", type=int, default=None, help="get channel status")
+
+    #set digital channel status
+    command_parser.add_argument("--setchannel", dest="setchannel", nargs=2, default=None, help="set channel status: <channel> <status>")
+    
+    #get several channels status: --getchannels
+    command_parser.add_argument("--getchannels", dest="getchannels", action="store_true", default=False, help="get the status of channels 1 to %s"%CHANNELS)
+
+    #set several channels status: --setchannels <channel>=<status> ...
+    command_parser.add_argument("--setchannels", dest="setchannels", nargs="+", default=None, help="set and verify several channels at once: <channel>=<status> ...")
+
+    #start: --start
+    command_parser.add_argument("--start", dest="start", action="store_true", default=False, help="start")
+
+    #stop: --stop
+    command_parser.add_argument("--stop", dest="stop", action="store_true", default=False, help="stop")
+
+    #custom command: --command <values>
+    command_parser.add_argument("--command", "-c", dest="command", nargs="+", default=None, help="custom command: command, ID, arguments")
+
+    #cycle: --cycle <n> <t1> <i1> <t2> <i2> <t3> <i3>
+    command_parser.add_argument("--cycle", dest="cycle", nargs=7, default=None, help="thermal cylcing: n, t1 [C], i1 ['], t2 [C], i2 ['], t3 [C], i3 [']")
+
+    return command_parser
+
+#******************************************
+if __name__ == "__main__":
+
+    #------------------------------------------
+    #import stuff
+    import argparse
+
+    #------------------------------------------
+    #logging setup
+    logging.basicConfig(format="%(levelname)s %(message)s", level=logging.INFO)
+
+    #------------------------------------------
+    #input arguments
+    parser = argparse.ArgumentParser(description="%prog [options]")
+
+    #configuration
+    parser.add_argument("-a", "--address", dest="address", type=str, required=False, default=None, help="climate chamber address (required unless dry-running)")
+    parser.add_argument("-p", "--port", dest="port", type=int, required=False, default=2049, help="climate chamber port")
+    parser.add_argument("-i", "--id", dest="id", type=int, required=False, default=1, help="climate chamber ID")
+    parser.add_argument("-t", "--tolerance", dest="tolerance", type=float, required=False, default=0.1, help="temperature tolerance [C]")
+    parser.add_argument("-r", "--refresh", dest="refresh", type=float, required=False, default=2.0, help="refresh interval [s]")
+    parser.add_argument("--rate", dest="rate", type=float, required=False, default=0., help="thermal cycling ramp rate [C/minute] (0: climate chamber rate)")
+    
+    #other
+    parser.add_argument("-v", "--verbose", dest="verbose", action="store_true", default=False, help="verbose mode")
+    parser.add_argument("-f", "--force", dest="force", action="store_true", default=False, help="force command")
+    parser.add_argument("--trace", dest="trace", type=str, required=False, default=None, help="trace file (JSONL)")
+    parser.add_argument("--format", dest="format", choices=["csv", "json"], default="csv", help="watch output format")
+    parser.add_argument("--count", dest="count", type=int, required=False, default=0, help="number of watch readings (0: until interrupted)")
+    parser.add_argument("--dryrun", dest="dryrun", action="store_true", default=False, help="dry-run the thermal cycling on a simulated climate chamber")
+    parser.add_argument("--detect", dest="detect", action="store_true", default=False, help="detect anomalies during the thermal cycling (stuck sensor, stalled ramp, oscillation, warning and error status)")
+    parser.add_argument("--lease", dest="lease", type=str, required=False, default=None, help="lease database (SQLite) on storage shared by the controller hosts")
+    parser.add_argument("--history", dest="history", type=str, required=False, default=None, help="program history database (SQLite)")
+    parser.add_argument("--variables", dest="variables", type=int, nargs="+", required=False, default=[TEMPERATURE], help="control variables to read with --getvalues and --watch (1: temperature, 2: humidity)")
+    parser.add_argument("--humidity", dest="humidity", type=float, nargs=3, required=False, default=None, help="thermal cycling humidity: h1, h2, h3 [%%]")
+    parser.add_argument("--humidity-tolerance", dest="humiditytolerance", type=float, required=False, default=1.0, help="humidity tolerance [%%]")
+    parser.add_argument("--dryair", dest="dryair", type=str, nargs=2, required=False, default=None, help="thermal cycling dry air: <channel> <temperature below which dry air is on [C]>")
+    parser.add_argument("--archive", dest="archive", type=str, required=False, default=None, help="telemetry archive (SQLite) of the readings taken by --watch and --cycle")
+    parser.add_argument("--retention", dest="retention", type=float, nargs=3, required=False, default=None, help="telemetry archive retention [days] of the raw readings, minute and hour rollups (default: 7 90 3650)")
+    parser.add_argument("--program", dest="program", type=str, required=False, default="", help="thermal cycling program name recorded in the history")
+    parser.add_argument("--model", dest="model", type=str, required=False, default=None, help="thermal model file (JSON) of the simulated climate chamber")
+
+    #------------------------------------------
+    #commands
+    command_parser = addCommands(parser)
+
+    #watch: --watch <interval>
+    command_parser.add_argument("--watch", "--stream", dest="watch", type=float, default=None, help="print actual and nominal temperatures every <interval> [s]")
+
+    #batch: --batch
+    command_parser.add_argument("--batch", dest="batch", action="store_true", default=False, help="read commands from the standard input, one per line (e.g. gettemp, settemp 20)")
+
+    #------------------------------------------
+    #parse input arguments
+    args = parser.parse_args()
+    if args.dryrun and args.cycle is None:
+        parser.error("--dryrun requires --cycle")
+    if not args.dryrun and args.address is None:
+        parser.error("the following arguments are required: -a/--address")
+    if args.refresh <= 0:
+        parser.error("the refresh interval must be positive")
+    if args.dryair is not None:
+        try:
+            args.dryair = (int(args.dryair[0]), float(args.dryair[1]))
+        except ValueError:
+            parser.error("invalid dry air: %s (expected <channel> <temperature>)"%" ".join(args.dryair))
+    
+    #------------------------------------------
+    #create climate chamber controller instance
+    #NOTE watch and batch modes keep a single connection open
+    trace = None
+    if args.trace is not None:
+        import simservtrace
+        trace = simservtrace.tracer(args.trace)
+    ccc = climatechambercontroller(args.address, args.port, args.id, trace, persistent=args.watch is not None or args.batch)
+
+    #------------------------------------------
+    #run
+
+    #dry run
+    if args.dryrun:
+        import simulation, thermalmodel
+        commands, timeline, duration = simulation.dryRun(
+            args.cycle,
+            args.tolerance,
+            args.refresh,
+            args.rate,
+            thermalmodel.thermalmodel.load(args.model) if args.model is not None else None,
+            #NOTE the history, the archive and the lease listen to the readings of a real run
+            callback=(lambda event, **fields: None) if args.history is not None or args.archive is not None or args.lease is not None else None,
+            detect=args.detect,
+            variables={HUMIDITY: args.humidity + [args.humiditytolerance]} if args.humidity is not None else None,
+            dryair=args.dryair)
+
+        #command sequence
+        if args.verbose:
+            for t, command, output in commands:
+                print("%9.1f s: %s -> %s"%(t, " ".join(command), " ".join(output)))
+
+        #timeline
+        for ii, step, temp, start, ramp, dwell in timeline:
+            print("cycle %s step %s: %.2f C at %.0f\' (ramp %.1f\', dwell %.0f\')"%(ii, step, temp, start/60., ramp/60., dwell/60.))
+        print("commands: %s"%len(commands))
+        print("duration: %.1f\'"%(duration/60.))
+
+    #watch
+    elif args.watch is not None:
+        watch(ccc, args.watch, args.format, args.count, args.verbose, args.variables, args.archive, args.retention)
+        ccc.close()
+
+    #batch
+    elif args.batch:
+        import shlex
+
+        #one command per line
+        batch_parser = argparse.ArgumentParser(prog="batch", add_help=False)
+        addCommands(batch_parser)
+        success = True
+        for line in sys.stdin:
+            tokens = shlex.split(line, comments=True)
+            if len(tokens) == 0:
+                continue
+
+            #NOTE the leading dashes can be omitted
+            if not tokens[0].startswith("-"):
+                tokens[0] = "--" + tokens[0]
+
+            #parse the command on top of the global options
+            try:
+                lineargs = batch_parser.parse_args(tokens, namespace=argparse.Namespace(**vars(args)))
+            except SystemExit:
+                logging.error("invalid command: %s"%line.strip())
+                success = False
+                continue
+
+            success = execute(ccc, lineargs) and success
+
+        ccc.close()
+        sys.exit(0 if success else 1)
+
+    #single command
+    elif not execute(ccc, args):
+        sys.exit(1)
@@ -7,17 +7,19 @@
 __author__ = "Francesco Guescini"
 __version__ = "0.0.0"
 __lockfile__ = "lock"
+__loglines__ = 200
+__lograte__ = 4
 
 #******************************************
 #import stuff
 import streamlit as st
 import streamlit.components.v1 as components
-import configparser, logging, time, sys, os, fasteners, multiprocessing, signal
-import climatechambercontroller
+import configparser, datetime, logging, time, os, socket, fasteners, multiprocessing, signal
+import climatechambercontroller, simservtrace, thermalmodel, scheduler, sharedstate, simulation, anomaly, runhistory, lease, programqueue, telemetry
 from streamlit.report_thread import REPORT_CONTEXT_ATTR_NAME
 from threading import current_thread
 from contextlib import contextmanager
-from io import StringIO
+from collections import deque
 from copy import deepcopy
 
 #******************************************
@@ -30,73 +32,192 @@ st.set_page_config(
     initial_sidebar_state = "expanded")
 
 #******************************************
-#redirect standard streams
-#https://discuss.streamlit.io/t/cannot-print-the-terminal-output-in-streamlit/6602
-#https://github.com/BugzTheBunny/streamlit_logging_output_example/blob/main/app.py
-@contextmanager
-def st_redirect(src, dst):
-    """Redirect a source to an output."""
-    placeholder = st.empty()
-    output_func = getattr(placeholder, dst)
-
-    with StringIO() as buffer:
-        old_write = src.write
-
-        def new_write(b):
-            if getattr(current_thread(), REPORT_CONTEXT_ATTR_NAME, None):
-                buffer.write(b + "")
-                output_func(buffer.getvalue() + "")
-            else:
-                old_write(b)
-
-        try:
-            src.write = new_write
-            yield
-            
-        finally:
-            src.write = old_write
+#show log records in a streamlit element
+#NOTE only the last lines are kept and the element is rendered at most a few times per second
+class st_loghandler(logging.Handler):
+    """Render the latest log records in a streamlit element."""
+
+    def __init__(self, dst, lines = __loglines__, rate = __lograte__):
+        logging.Handler.__init__(self, logging.INFO)
+        self.setFormatter(logging.Formatter("%(levelname)s %(message)s"))
+        self.output_func = getattr(st.empty(), dst)
+        self.lines = deque(maxlen = lines)
+        self.interval = 1./rate
+        self.last = 0.
+        self.pending = False
+
+    def emit(self, record):
+        self.lines.append(self.format(record))
+        self.pending = True
+
+        #NOTE only the streamlit script thread can render
+        if getattr(current_thread(), REPORT_CONTEXT_ATTR_NAME, None) and time.time() - self.last >= self.interval:
+            self.render()
+
+    def render(self):
+        if self.pending:
+            self.output_func("\n".join(self.lines))
+            self.last = time.time()
+            self.pending = False
 
 #******************************************
-#redirect standard output
-#https://discuss.streamlit.io/t/cannot-print-the-terminal-output-in-streamlit/6602
-#https://github.com/BugzTheBunny/streamlit_logging_output_example/blob/main/app.py
+#show log records in a streamlit element within a block
 @contextmanager
-def st_stdout(dst):
-    """Redirect standard output."""
-    with st_redirect(sys.stdout, dst):
+def st_logging(dst):
+    """Show log records in a streamlit element."""
+    handler = st_loghandler(dst)
+    logger = logging.getLogger()
+    level = logger.level
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+
+    try:
         yield
 
+    finally:
+        logger.removeHandler(handler)
+        logger.setLevel(level)
+        with handler.lock:
+            handler.render()
+
 #******************************************
-#redirect standard error
-#https://discuss.streamlit.io/t/cannot-print-the-terminal-output-in-streamlit/6602
-#https://github.com/BugzTheBunny/streamlit_logging_output_example/blob/main/app.py
-@contextmanager
-def st_stderr(dst):
-    """Redirect standard error."""
-    with st_redirect(sys.stderr, dst):
-        yield
+#SIMSERV tracer shared by all sessions
+@st.cache(allow_output_mutation = True)
+def getTracer(path):
+    return simservtrace.tracer(path)
+
+#******************************************
+#program state shared with the program process
+@st.cache(allow_output_mutation = True)
+def getSharedState(name):
+    return sharedstate.sharedstate(name, create = True)
 
 #******************************************
 #run program
 #need to acquire lock on __lockfile__ to run the program
+#NOTE the programs queued for the climate chamber run right after, back to back (args can be None to only run those)
 @fasteners.interprocess_locked(__lockfile__)
-def runProgram(address, port, id, args, tolerance, refresh, verbose, force):
+def runProgram(address, port, id, args, tolerance, refresh, verbose, force, trace = "", rate = 0., detect = False, history = "", name = "", program = "", leasefile = "", variables = None, dryair = None, queue = "", archive = "", retention = telemetry.RETENTION):
 
     #new climate chamber controller instance
-    ccc = climatechambercontroller.climatechambercontroller(address, port, id)
+    #NOTE the tracer thread is not inherited by this process
+    ccc = climatechambercontroller.climatechambercontroller(
+        address,
+        port,
+        id,
+        simservtrace.tracer(trace) if trace != "" else None)
+
+    #stop gracefully when terminated
+    #NOTE the program stops the climate chamber and reports its end, then the trace and the lease are closed below
+    def interrupt(signum, frame):
+        raise KeyboardInterrupt("program terminated")
+    signal.signal(signal.SIGTERM, interrupt)
+
+    #attach to the shared program state created by the GUI
+    state = sharedstate.sharedstate(sharedstate.name(address, port, id))
+
+    #renew the lease acquired by the GUI on this host
+    owner = None
+    if leasefile != "":
+        owner = lease.lease(leasefile, address, port, id, socket.gethostname())
+
+    #------------------------------------------
+    #program callback
+    def programCallback(program, parameters):
 
-    #start cycle
-    ccc.cycle(args, tolerance, refresh, verbose, force)
+        callback = state.callback
+
+        #trace
+        if ccc.trace is not None:
+            callback = climatechambercontroller.chain(callback, ccc.trace.callback)
+
+        #anomaly detection
+        if detect:
+            callback = climatechambercontroller.chain(callback, anomaly.detector(parameters["tolerance"]).callback)
+
+        #program history
+        if history != "":
+            callback = climatechambercontroller.chain(callback, runhistory.recorder(history, ccc.chamber, name, program, parameters).callback)
+
+        #telemetry archive of the temperature and of the other control variables
+        if archive != "":
+            for variable in [climatechambercontroller.TEMPERATURE] + [int(variable) for variable in (parameters["variables"] or {})]:
+                callback = climatechambercontroller.chain(callback, telemetry.archive(archive, ccc.chamber, variable, retention).callback)
+
+        #lease
+        if owner is not None:
+            callback = climatechambercontroller.chain(callback, owner.callback)
+
+        return callback
+
+    try:
+
+        #------------------------------------------
+        #start cycle
+        output = ["1"]
+        if args is not None:
+            output = ccc.cycle(args, tolerance, refresh, verbose, force, rate,
+                programCallback(program, {"cycle": list(args), "tolerance": tolerance, "refresh": refresh, "rate": rate, "variables": variables, "dryair": dryair}),
+                variables,
+                dryair)
+
+        #------------------------------------------
+        #queued programs
+        if queue != "" and output[0] == "1":
+            def jobCallback(job):
+                with open(__lockfile__, "w") as f:
+                    f.write(str(os.getpid()) + "\n")
+                    f.write("queued program %s"%programqueue.describe(job))
+                return programCallback(job["program"], job["parameters"])
+            #NOTE the force decision only applies to the program started by the user, queued programs only start if the climate chamber is available
+            programqueue.run(queue, ccc, refresh, verbose, False, jobCallback)
 
-    #finally clean up the lock file
-    with open(__lockfile__, "w") as f:
-        f.truncate(0)
+    #------------------------------------------
+    #clean up
+    #NOTE multiprocessing children exit without running the atexit hooks
+    finally:
+        if ccc.trace is not None:
+            ccc.trace.close()
+        state.close()
+        if owner is not None:
+            owner.release()
+            owner.close()
+
+        #finally clean up the lock file
+        with open(__lockfile__, "w") as f:
+            f.truncate(0)
 
     return
 
+#******************************************
+#terminate a program process and wait for it to exit
+#return whether it exited before the timeout
+def terminate(pid, timeout = 10.):
+
+    try:
+        os.kill(pid, signal.SIGTERM)
+    except ProcessLookupError:
+        return True
+
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+
+        #NOTE the process is reaped if it is a child of this process
+        try:
+            if os.waitpid(pid, os.WNOHANG)[0] == pid:
+                return True
+        except ChildProcessError:
+            try:
+                os.kill(pid, 0)
+            except ProcessLookupError:
+                return True
+        time.sleep(0.1)
+
+    return False
+
 #******************************************
 #stop climate chamber activities
-def stop(ccc, container, verbose):
+def stop(ccc, container, verbose, history = "", owner = None, queue = ""):
 
     #------------------------------------------
     #kill any running program
@@ -107,13 +228,29 @@ def stop(ccc, container, verbose):
         if pid != "":
             pid = int(pid)
 
-            #kill the process
-            container.text("killing process: %s"%pid)
-            os.kill(pid, signal.SIGKILL)
+            #terminate the process, so that it can stop the program and close its files
+            #NOTE the process is killed if it does not exit in time
+            container.text("terminating process: %s"%pid)
+            if not terminate(pid):
+                container.text("killing process: %s"%pid)
+                os.kill(pid, signal.SIGKILL)
 
             #clean up the lock file
             f.truncate(0)
 
+            #reset the shared program state
+            getSharedState(sharedstate.name(ccc.address, ccc.port, ccc.id)).write(phase = sharedstate.IDLE)
+
+            #the program did not get to record its end
+            if history != "":
+                runhistory.interrupt(history, ccc.chamber)
+            if queue != "":
+                programqueue.interrupt(queue, ccc.chamber)
+
+            #release the lease held by this host
+            if owner is not None:
+                owner.release()
+
     #------------------------------------------
     #stop the climate the chamber itself
     output = ccc.stop(verbose = verbose)
@@ -127,7 +264,17 @@ def stop(ccc, container, verbose):
 
 #******************************************
 #check whether the climate chamber is available
-def isAvailable(ccc, force, forcestop, container, verbose):
+def isAvailable(ccc, force, forcestop, container, verbose, history = "", owner = None, queue = ""):
+
+    #------------------------------------------
+    #climate chamber leased by another host
+    holder = owner.holder() if owner is not None else None
+    if holder is not None and holder[0] != owner.owner:
+        if force:
+            container.warning("the climate chamber is leased by %s until %s  \nforcing"%(holder[0], time.ctime(holder[1])))
+        else:
+            container.warning("the climate chamber is leased by %s until %s  \nwill not proceed"%(holder[0], time.ctime(holder[1])))
+            return False
 
     #------------------------------------------
     #program running
@@ -143,7 +290,7 @@ def isAvailable(ccc, force, forcestop, container, verbose):
         if force:
             container.warning("a program is currently running with PID %s:  \n%s  \nforcing"%(pid, program))
             if forcestop:
-                stop(ccc, container, verbose)
+                stop(ccc, container, verbose, history, owner, queue)
             return True
         else:
             container.warning("a program is currently running with PID %s:  \n%s  \nwill not proceed"%(pid, program))
@@ -155,7 +302,7 @@ def isAvailable(ccc, force, forcestop, container, verbose):
         if force:
             container.warning("the climate chamber is currently busy  \nforcing")
             if forcestop:
-                stop(ccc, container, verbose)
+                stop(ccc, container, verbose, history, owner, queue)
             return True
         else:
             container.warning("the climate chamber is currently busy  \nwill not proceed")
@@ -188,9 +335,9 @@ def main():
         components.iframe(ccconfig["iframe"], height = int(ccconfig["iframe_height"]), scrolling = True)
 
     #------------------------------------------
-    #redirect standard output and error to streamlit code
+    #show log records as streamlit code
     #NOTE after the iframe
-    with st_stdout("code"), st_stderr("code"):
+    with st_logging("code"):
 
         #------------------------------------------
         #add items below the iframe
@@ -206,10 +353,27 @@ def main():
             container.error("climate chamber address, port or ID invalid")
             return
         
+        #NOTE all sessions share the same per-chamber scheduler
+        #NOTE programs run in a dedicated process with their own connection
+        trace = ccconfig.get("trace", "")
+        history = ccconfig.get("history", "")
+        queue = ccconfig.get("queue", "")
+        archive = ccconfig.get("telemetry", "")
+        retention = tuple(float(days) for days in ccconfig["retention"].split(",")) if ccconfig.get("retention", "") != "" else telemetry.RETENTION
+
+        #NOTE the lease is owned by this host, programs run on it renew the lease
+        leasefile = ccconfig.get("lease", "")
+        owner = lease.lease(leasefile, ccconfig["address"], int(ccconfig["port"]), int(ccconfig["id"]), socket.gethostname()) if leasefile != "" else None
         ccc = climatechambercontroller.climatechambercontroller(
             ccconfig["address"],
             int(ccconfig["port"]),
-            int(ccconfig["id"]))
+            int(ccconfig["id"]),
+            scheduler = scheduler.getScheduler(
+                ccconfig["address"],
+                int(ccconfig["port"]),
+                int(ccconfig["id"]),
+                float(ccconfig.get("rate_limit", "") or 0),
+                trace = getTracer(trace) if trace != "" else None))
     
         #------------------------------------------
         #session state variables
@@ -266,6 +430,10 @@ def main():
         if "tolerance" not in st.session_state:
             st.session_state.tolerance = float(programs["DEFAULT"]["tolerance"])
 
+        #ramp rate
+        if "ramprate" not in st.session_state:
+            st.session_state.ramprate = float(programs["DEFAULT"].get("ramp_rate", "0"))
+
         #------------------------------------------
         #sidebar columns
         col1of2, col2of2 = st.sidebar.columns(2)
@@ -295,8 +463,9 @@ def main():
             else:
                 container.text("status: unknown (%s)"%status)
 
-            container.text("actual temperature:  %.2f C"%float(ccc.getActualTemperature(verbose)[1]))
-            container.text("nominal temperature: %.2f C"%float(ccc.getNominalTemperature(verbose)[1]))
+            values = ccc.readValues(verbose = verbose)
+            container.text("actual temperature:  %.2f C"%values[0, 0])
+            container.text("nominal temperature: %.2f C"%values[1, 0])
             container.text("dry air: %s"%("ON" if int(ccc.getChannel(ccconfig["dry_air_channel"], verbose)[1]) else "OFF"))
             if os.path.getsize(__lockfile__):
                 with open(__lockfile__, "r") as f:
@@ -306,7 +475,7 @@ def main():
         #==========================================
         #stop operations
         if col2of2.button("stop"):
-            stop(ccc, container, verbose)
+            stop(ccc, container, verbose, history, owner, queue)
 
         #==========================================
         #toggle dry air
@@ -314,29 +483,25 @@ def main():
 
             #------------------------------------------
             #check whether the climate chamber is available
-            if isAvailable(ccc, force, False, container, verbose):
+            if isAvailable(ccc, force, False, container, verbose, history, owner, queue):
 
                 #------------------------------------------
                 #store initial value
                 initialvalue = deepcopy(st.session_state.dryair)
 
                 #------------------------------------------
-                #send dry air setting to the climate chamber
-                output = ccc.setChannel(
-                    int(ccconfig["dry_air_channel"]),
-                    int(not st.session_state.dryair),
-                    verbose,
-                    force)
+                #send dry air setting to the climate chamber and read it back in the same batch
+                #NOTE the availability has already been checked
+                channel = int(ccconfig["dry_air_channel"])
+                output = ccc.writeChannels({channel: int(not st.session_state.dryair)}, verbose, force = True)
 
-                #give it some time
-                time.sleep(0.2)
-
-                if output[0] != "1" or len(output) != 1:
+                if output[0] != "1":
                     container.error("there was an error setting the dry air: %s"%" ".join(output))
 
                 #------------------------------------------
-                #read back dry air channel status
-                st.session_state.dryair = bool( int(ccc.getChannel( int(ccconfig["dry_air_channel"]) )[1]))
+                #dry air channel status read back
+                if len(output) > 1:
+                    st.session_state.dryair = bool((int(output[1]) >> (channel - 1)) & 1)
 
                 #------------------------------------------
                 #check whether the dry air status has changed since the beginning
@@ -349,11 +514,26 @@ def main():
         #dry air status
         col1of2.markdown("dry air: **%s**"%("ON" if st.session_state.dryair else "OFF"))
 
+        #------------------------------------------
+        #program progress
+        #NOTE read from shared memory, without querying the climate chamber nor reading the lock file
+        state = getSharedState(sharedstate.name(ccconfig["address"], ccconfig["port"], ccconfig["id"])).read()
+        if state is not None and state["phase"] in [sharedstate.RAMP, sharedstate.DWELL]:
+            st.sidebar.progress(min(1., (state["cycle"] + 0.5*(state["step"] - 1))/max(1, state["ncycles"])))
+            if state["step"] == 3:
+                progress = "final step: %s"%sharedstate.PHASES[state["phase"]]
+            else:
+                progress = "cycle %s/%s, step %s: %s"%(state["cycle"] + 1, state["ncycles"], state["step"], sharedstate.PHASES[state["phase"]])
+            if state["phase"] == sharedstate.DWELL:
+                progress += " (%.0f' left)"%max(0., (state["deadline"] - time.time())/60.)
+            st.sidebar.text(progress)
+            st.sidebar.text("setpoint %.2f C, actual %.2f C"%(state["setpoint"], state["actual"]))
+
         #==========================================
         #mode selection
         mode = st.sidebar.selectbox(
             "operation mode",
-            ["set", "program"])
+            ["set", "program"] + (["queue"] if queue != "" else []) + (["history"] if history != "" else []) + (["telemetry"] if archive != "" else []))
 
         #==========================================
         #set temperature
@@ -374,7 +554,7 @@ def main():
 
                 #------------------------------------------
                 #check whether the climate chamber is available
-                if isAvailable(ccc, force, True, container, verbose):
+                if isAvailable(ccc, force, True, container, verbose, history, owner, queue):
 
                     #------------------------------------------
                     #set nominal temperature
@@ -413,6 +593,7 @@ def main():
                 dwelltime2 = st.session_state.dwelltime2
                 dwelltime3 = st.session_state.dwelltime3
                 tolerance = st.session_state.tolerance
+                ramprate = st.session_state.ramprate
 
             else:
                 #load values from programs config file
@@ -424,6 +605,23 @@ def main():
                 dwelltime2 = int(programs[program]["dwell_time_2"])
                 dwelltime3 = int(programs[program]["dwell_time_3"])
                 tolerance = float(programs[program]["tolerance"])
+                ramprate = float(programs[program].get("ramp_rate", "0"))
+
+            #humidity (optional, not editable)
+            variables = None
+            if programs[program].get("humidity_1", "") != "":
+                variables = {climatechambercontroller.HUMIDITY: (
+                    float(programs[program]["humidity_1"]),
+                    float(programs[program]["humidity_2"]),
+                    float(programs[program]["humidity_3"]),
+                    float(programs[program].get("humidity_tolerance", "") or 1.))}
+                st.sidebar.text("humidity: %s %%, %s %%, %s %% (tolerance: %s %%)"%variables[climatechambercontroller.HUMIDITY])
+
+            #dry air at the cold steps (optional, not editable)
+            dryair = None
+            if programs[program].get("dry_air_below", "") != "" and ccconfig["dry_air_channel"] != "":
+                dryair = (int(ccconfig["dry_air_channel"]), float(programs[program]["dry_air_below"]))
+                st.sidebar.text("dry air below %s C"%dryair[1])
             
             #------------------------------------------
             #program settings
@@ -494,6 +692,16 @@ def main():
                 format = "%f C")
             settings.markdown("---")
 
+            #ramp rate
+            ramprate = settings.slider(
+                "ramp rate (0: climate chamber rate)",
+                0.,
+                10.,
+                ramprate,
+                0.5,
+                format = "%f C/minute")
+            settings.markdown("---")
+
             #------------------------------------------
             #store values in session state
             if program == "default":
@@ -505,6 +713,41 @@ def main():
                 st.session_state.dwelltime2 = dwelltime2
                 st.session_state.dwelltime3 = dwelltime3
                 st.session_state.tolerance = tolerance
+                st.session_state.ramprate = ramprate
+
+            #------------------------------------------
+            #estimated duration from the climate chamber thermal model
+            #NOTE the program is assumed to start from the current nominal temperature
+            if ccconfig.get("model", "") != "" and os.path.exists(ccconfig["model"]):
+                timeline, duration = thermalmodel.predict(
+                    thermalmodel.thermalmodel.load(ccconfig["model"]),
+                    (ncycles, temperature1, dwelltime1, temperature2, dwelltime2, temperature3, dwelltime3),
+                    tolerance,
+                    st.session_state.temperature,
+                    ramprate)
+                ramps = sum(ramp for _, _, _, _, ramp, _ in timeline)
+                st.sidebar.markdown("estimated duration: **%dh %02d'** (ramps: %dh %02d')"%(
+                    duration//3600, duration%3600//60, ramps//3600, ramps%3600//60))
+
+            #------------------------------------------
+            #dry run on a simulated climate chamber
+            #NOTE the program is assumed to start from the current nominal temperature
+            if settings.form_submit_button(label = "dry run"):
+                commands, timeline, duration = simulation.dryRun(
+                    (ncycles, temperature1, dwelltime1, temperature2, dwelltime2, temperature3, dwelltime3),
+                    tolerance,
+                    float(ccconfig["refresh"]),
+                    ramprate,
+                    thermalmodel.thermalmodel.load(ccconfig["model"]) if ccconfig.get("model", "") != "" and os.path.exists(ccconfig["model"]) else None,
+                    st.session_state.temperature,
+                    #NOTE the programs launched from the GUI always report their readings to the shared program state
+                    callback = lambda event, **fields: None,
+                    detect = bool(int(ccconfig.get("detect", "") or 0)),
+                    variables = variables,
+                    dryair = dryair)
+                for ii, step, temp, start, ramp, dwell in timeline:
+                    container.text("cycle %s step %s: %.2f C at %.0f' (ramp %.1f', dwell %.0f')"%(ii, step, temp, start/60., ramp/60., dwell/60.))
+                container.text("dry run: %s commands, duration %dh %02d'"%(len(commands), duration//3600, duration%3600//60))
 
             #------------------------------------------
             #run program
@@ -512,7 +755,7 @@ def main():
 
                 #------------------------------------------
                 #check whether the climate chamber is available
-                if isAvailable(ccc, force, True, container, verbose):
+                if isAvailable(ccc, force, True, container, verbose, history, owner, queue):
 
                     #------------------------------------------
                     #launch program
@@ -525,6 +768,12 @@ def main():
                             dwelltime2,
                             temperature3,
                             dwelltime3)
+                    if ramprate > 0:
+                        programstring += " ramping at %s C/minute"%ramprate
+                    if variables is not None:
+                        programstring += " with humidity %s %%, %s %% and %s %%"%variables[climatechambercontroller.HUMIDITY][:3]
+                    if dryair is not None:
+                        programstring += " with dry air below %s C"%dryair[1]
                     container.text(programstring)
                     
                     #------------------------------------------
@@ -547,7 +796,26 @@ def main():
                         tolerance,
                         float(ccconfig["refresh"]),
                         verbose,
-                        force)
+                        force,
+                        trace,
+                        ramprate,
+                        bool(int(ccconfig.get("detect", "") or 0)),
+                        history,
+                        climatechamber,
+                        program,
+                        leasefile,
+                        variables,
+                        dryair,
+                        queue,
+                        archive,
+                        retention)
+
+                    #------------------------------------------
+                    #acquire the lease
+                    #NOTE a single round trip either takes the lease or fails
+                    if owner is not None and not owner.acquire(force):
+                        container.error("the climate chamber has just been leased by another host")
+                        return
 
                     #create process
                     p = multiprocessing.Process(target = runProgram, args = args)
@@ -557,6 +825,157 @@ def main():
                         f.write( str(p.pid) + "\n")
                         f.write(programstring)
 
+            #------------------------------------------
+            #queue program
+            #NOTE queued programs start as soon as the running one is over, or right away if none is running
+            if queue != "" and settings.form_submit_button(label = "queue"):
+                job = programqueue.enqueue(
+                    queue,
+                    ccc.chamber,
+                    program,
+                    programqueue.parameters(
+                        (ncycles, temperature1, dwelltime1, temperature2, dwelltime2, temperature3, dwelltime3),
+                        tolerance,
+                        ramprate,
+                        variables,
+                        dryair))
+                container.text("queued program %s"%job)
+
+                #------------------------------------------
+                #start the queue
+                if os.path.getsize(__lockfile__) == 0 and ccc.isAvailable(verbose) and (owner is None or owner.acquire()):
+                    p = multiprocessing.Process(target = runProgram, args = (
+                        ccconfig["address"],
+                        int(ccconfig["port"]),
+                        int(ccconfig["id"]),
+                        None,
+                        tolerance,
+                        float(ccconfig["refresh"]),
+                        verbose,
+                        force,
+                        trace,
+                        ramprate,
+                        bool(int(ccconfig.get("detect", "") or 0)),
+                        history,
+                        climatechamber,
+                        program,
+                        leasefile,
+                        None,
+                        None,
+                        queue,
+                        archive,
+                        retention))
+                    p.start()
+                    container.text("created process with ID %s"%p.pid)
+                    with open(__lockfile__, "w") as f:
+                        f.write( str(p.pid) + "\n")
+                        f.write("queued programs")
+
+        #==========================================
+        #program queue
+        elif mode == "queue":
+
+            #------------------------------------------
+            #reorder
+            jobs = programqueue.jobs(queue, ccc.chamber, (programqueue.QUEUED,))
+            if len(jobs) > 0:
+                reorder = st.sidebar.form(key = "reorder")
+                job = reorder.selectbox("program", [job["id"] for job in jobs], format_func = lambda job: programqueue.describe([other for other in jobs if other["id"] == job][0]))
+                action = reorder.radio("action", ["up", "down", "priority", "cancel"])
+                priority = reorder.number_input("priority (lowest first)", value = 0, step = 1)
+                if reorder.form_submit_button(label = "apply"):
+                    if action == "up":
+                        programqueue.move(queue, job, -1)
+                    elif action == "down":
+                        programqueue.move(queue, job, 1)
+                    elif action == "priority":
+                        programqueue.prioritize(queue, job, int(priority))
+                    elif action == "cancel":
+                        programqueue.cancel(queue, job)
+
+            #------------------------------------------
+            #queued and running programs, in the order they will run
+            jobs = programqueue.jobs(queue, ccc.chamber)
+            if len(jobs) == 0:
+                container.text("no programs queued")
+            for job in jobs:
+                container.text("%s%s"%(programqueue.describe(job), " [running]" if job["status"] == programqueue.RUNNING else ""))
+
+        #==========================================
+        #program history
+        elif mode == "history":
+
+            #------------------------------------------
+            #filters
+            query = st.sidebar.form(key = "query")
+            program = query.selectbox("program", ["all"] + programs.sections())
+            since = query.date_input("since", datetime.date.today() - datetime.timedelta(days = 30))
+            query.form_submit_button(label = "query")
+
+            #------------------------------------------
+            #runs
+            #NOTE the summaries are precomputed while the programs run
+            runs = runhistory.query(
+                history,
+                climatechamber,
+                None if program == "all" else program,
+                time.mktime(since.timetuple()))
+            if len(runs) == 0:
+                container.text("no programs found")
+            else:
+                container.table([{
+                    "run": run["id"],
+                    "program": run["program"],
+                    "start": time.strftime("%Y-%m-%d %H:%M", time.localtime(run["start"])),
+                    "end": time.strftime("%Y-%m-%d %H:%M", time.localtime(run["end"])) if run["end"] is not None else "",
+                    "status": run["status"],
+                    "steps": run["steps"],
+                    "max overshoot [C]": "%.2f"%run["max_overshoot"],
+                    "max time to target [']": "%.1f"%(run["max_time_to_target"]/60.),
+                    "max dwell std [C]": "%.3f"%run["max_dwell_std"]} for run in runs])
+
+                #------------------------------------------
+                #steps of a run
+                run = container.selectbox("run", [run["id"] for run in runs])
+                container.table([{
+                    "cycle": step["cycle"],
+                    "step": step["step"],
+                    "setpoint [C]": "%.2f"%step["setpoint"],
+                    "time to target [']": "%.1f"%(step["time_to_target"]/60.) if step["time_to_target"] is not None else "",
+                    "overshoot [C]": "%.2f"%step["overshoot"],
+                    "dwell mean [C]": "%.2f"%step["dwell_mean"] if step["dwell_n"] > 0 else "",
+                    "dwell std [C]": "%.3f"%step["dwell_std"] if step["dwell_n"] > 0 else ""} for step in runhistory.steps(history, run)])
+
+        #==========================================
+        #telemetry
+        elif mode == "telemetry":
+
+            #------------------------------------------
+            #time range
+            query = st.sidebar.form(key = "telemetry")
+            variable = query.selectbox("variable", list(climatechambercontroller.VARIABLES), format_func = lambda variable: climatechambercontroller.VARIABLES[variable][0])
+            since = query.date_input("since", datetime.date.today() - datetime.timedelta(days = 1))
+            until = query.date_input("until", datetime.date.today())
+            query.form_submit_button(label = "query")
+
+            #------------------------------------------
+            #NOTE the finest tier (raw samples, minute or hour rollups) with at most 1000 points is read
+            tier, times, low, mean, high = telemetry.query(
+                archive,
+                ccc.chamber,
+                time.mktime(since.timetuple()),
+                time.mktime((until + datetime.timedelta(days = 1)).timetuple()),
+                variable)
+            if len(times) == 0:
+                container.text("no readings found")
+            else:
+                unit = climatechambercontroller.VARIABLES[variable][1]
+                container.text("%s readings from %s to %s"%(
+                    tier if tier == "raw" else "%s (min, mean, max)"%tier,
+                    time.strftime("%Y-%m-%d %H:%M", time.localtime(times[0])),
+                    time.strftime("%Y-%m-%d %H:%M", time.localtime(times[-1]))))
+                container.line_chart({"min [%s]"%unit: low, "mean [%s]"%unit: mean, "max [%s]"%unit: high} if tier != "raw" else {"actual [%s]"%unit: mean})
+
         #==========================================
         #version
         st.sidebar.markdown("---")
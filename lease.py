@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+
+#******************************************
+#Leases on climate chambers shared between controller hosts.
+
+#******************************************
+__author__ = "Francesco Guescini"
+__version__ = "0.0.0"
+
+#******************************************
+#import stuff
+import logging, os, socket, sqlite3, time
+import climatechambercontroller
+
+#******************************************
+#default lease duration [s]
+TTL = 60.
+
+#******************************************
+#database schema
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS leases (
+    chamber TEXT PRIMARY KEY,
+    owner TEXT,
+    expires REAL);
+"""
+
+#******************************************
+def key(address, port, id):
+    """Lease key of a climate chamber."""
+    return "%s:%s/%s"%(address, port, id)
+
+#******************************************
+class lease:
+    """A lease on a climate chamber stored in an SQLite database on storage shared by the controller hosts.
+
+    Acquiring, renewing and releasing the lease are single statements, i.e. one round trip to the database.
+    A lease that is not renewed expires after its TTL and can then be acquired by another owner.
+    NOTE the shared storage must support SQLite file locking (e.g. SMB or NFS with locking enabled).
+    """
+
+    #******************************************
+    def __init__(self, path, address, port, id, owner=None, ttl=TTL):
+        """Initialize the lease.
+
+        The default owner is the host name and process ID.
+        """
+
+        self.path = path
+        self.chamber = key(address, port, id)
+        self.owner = owner if owner is not None else "%s:%s"%(socket.gethostname(), os.getpid())
+        self.ttl = ttl
+        self.renewed = 0.
+        self.db = None
+
+        return
+
+    #******************************************
+    def __connect__(self):
+        """Open the lease database, creating it if needed."""
+
+        if self.db is None:
+            self.db = sqlite3.connect(self.path, timeout=10., isolation_level=None)
+            self.db.execute(SCHEMA)
+
+        return self.db
+
+    #******************************************
+    def acquire(self, force=False):
+        """Acquire the lease if it is free, expired or already owned; force takes it over in any case.
+
+        Return whether the lease was acquired.
+        """
+
+        now = time.time()
+        cursor = self.__connect__().execute(
+            "INSERT INTO leases (chamber, owner, expires) VALUES (?, ?, ?) "
+            "ON CONFLICT (chamber) DO UPDATE SET owner = excluded.owner, expires = excluded.expires "
+            "WHERE leases.owner = excluded.owner OR leases.expires < ? OR ?",
+            (self.chamber, self.owner, now + self.ttl, now, force))
+        if cursor.rowcount == 1:
+            self.renewed = now
+            return True
+
+        return False
+
+    #******************************************
+    def renew(self):
+        """Extend the lease.
+
+        Return False if the lease has been taken over by another owner.
+        """
+
+        now = time.time()
+        cursor = self.__connect__().execute(
+            "UPDATE leases SET expires = ? WHERE chamber = ? AND owner = ?",
+            (now + self.ttl, self.chamber, self.owner))
+        if cursor.rowcount == 1:
+            self.renewed = now
+            return True
+
+        return False
+
+    #******************************************
+    def release(self):
+        """Release the lease if owned."""
+
+        self.__connect__().execute("DELETE FROM leases WHERE chamber = ? AND owner = ?", (self.chamber, self.owner))
+        self.renewed = 0.
+
+        return
+
+    #******************************************
+    def holder(self):
+        """Get the current owner and expiration time [s] of the lease, or None if it is free."""
+
+        row = self.__connect__().execute(
+            "SELECT owner, expires FROM leases WHERE chamber = ? AND expires >= ?",
+            (self.chamber, time.time())).fetchone()
+
+        return tuple(row) if row is not None else None
+
+    #******************************************
+    def close(self):
+        """Close the lease database."""
+
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+        return
+
+    #******************************************
+    def callback(self, event, **fields):
+        """Renew the lease on the climate chamber readings of a running program.
+
+        The lease is renewed at most every quarter of its TTL.
+        Return RELEASE if the lease has been lost, so that the program stops without interfering with the new owner.
+        """
+
+        try:
+            if event in ["reading", "dwell"] and time.time() - self.renewed > self.ttl/4.:
+                if not self.renew():
+                    holder = self.holder()
+                    logging.error("the lease on the climate chamber has been taken over%s"%(" by %s"%holder[0] if holder is not None else ""))
+                    return climatechambercontroller.RELEASE
+
+        #NOTE a database error does not stop the program; the lease expires unless renewed later
+        except sqlite3.Error as e:
+            logging.error("there was an error while renewing the lease: %s"%e)
+
+        return None
@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+
+#******************************************
+#A persistent per-chamber queue of thermal cycling programs run back to back.
+
+#******************************************
+__author__ = "Francesco Guescini"
+__version__ = "0.0.0"
+
+#******************************************
+#import stuff
+import json, logging, sqlite3, time
+
+#******************************************
+#database schema
+#NOTE jobs are taken by priority (lowest first), then by rank (reordering swaps ranks)
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    chamber TEXT,
+    program TEXT,
+    parameters TEXT,
+    priority INTEGER DEFAULT 0,
+    rank INTEGER,
+    status TEXT,
+    submitted REAL,
+    started REAL,
+    ended REAL);
+CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (chamber, status, priority, rank);
+"""
+
+#job statuses
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+INTERRUPTED = "interrupted"
+CANCELLED = "cancelled"
+
+#******************************************
+def connect(path):
+    """Open the queue database, creating it if needed."""
+
+    db = sqlite3.connect(path, timeout=10., isolation_level=None)
+    db.row_factory = sqlite3.Row
+    db.executescript(SCHEMA)
+
+    return db
+
+#******************************************
+def __job__(row):
+    """Convert a job row to a dictionary with its parameters."""
+
+    job = dict(row)
+    job["parameters"] = json.loads(job["parameters"])
+
+    return job
+
+#******************************************
+def parameters(cycle, tolerance=0.1, rate=0., variables=None, dryair=None):
+    """Collect the parameters of a thermal cycling program (see climatechambercontroller.cycle)."""
+
+    return {
+        "cycle": [float(value) for value in cycle],
+        "tolerance": tolerance,
+        "rate": rate,
+        "variables": {str(variable): list(values) for variable, values in variables.items()} if variables is not None else None,
+        "dryair": list(dryair) if dryair is not None else None}
+
+#******************************************
+def fromProgram(program, dryair=None):
+    """Collect the parameters of a program from programs.conf.
+
+    The dry air channel comes from the climate chamber configuration (ccc.conf).
+    """
+
+    import climatechambercontroller
+
+    variables = None
+    if program.get("humidity_1", "") != "":
+        variables = {climatechambercontroller.HUMIDITY: (
+            float(program["humidity_1"]),
+            float(program["humidity_2"]),
+            float(program["humidity_3"]),
+            float(program.get("humidity_tolerance", "") or 1.))}
+
+    return parameters(
+        [program["n_cycles"], program["temperature_1"], program["dwell_time_1"], program["temperature_2"], program["dwell_time_2"], program["temperature_3"], program["dwell_time_3"]],
+        float(program["tolerance"]),
+        float(program.get("ramp_rate", "") or 0),
+        variables,
+        (int(dryair), float(program["dry_air_below"])) if dryair not in [None, ""] and program.get("dry_air_below", "") != "" else None)
+
+#******************************************
+def cycleArguments(job):
+    """Get the climatechambercontroller.cycle arguments of a job: arglist, tolerance, rate, variables and dry air."""
+
+    p = job["parameters"]
+
+    return (
+        [int(value) for value in p["cycle"]],
+        p["tolerance"],
+        p["rate"],
+        {int(variable): tuple(values) for variable, values in p["variables"].items()} if p["variables"] is not None else None,
+        tuple(p["dryair"]) if p["dryair"] is not None else None)
+
+#******************************************
+def enqueue(path, chamber, program, parameters, priority=0):
+    """Add a program to the queue of a climate chamber and return the job ID."""
+
+    db = connect(path)
+    with db:
+        db.execute("BEGIN IMMEDIATE")
+        job = db.execute(
+            "INSERT INTO jobs (chamber, program, parameters, priority, rank, status, submitted) "
+            "VALUES (?, ?, ?, ?, (SELECT COALESCE(MAX(rank), 0) + 1 FROM jobs WHERE chamber = ?), ?, ?)",
+            (chamber, program, json.dumps(parameters), priority, chamber, QUEUED, time.time())).lastrowid
+    db.close()
+
+    return job
+
+#******************************************
+def jobs(path, chamber, statuses=(QUEUED, RUNNING)):
+    """Get the jobs of a climate chamber with the given statuses, in the order they will run."""
+
+    db = connect(path)
+    rows = db.execute(
+        "SELECT * FROM jobs WHERE chamber = ? AND status IN (%s) ORDER BY status = 'running' DESC, priority, rank"%", ".join("?"*len(statuses)),
+        [chamber] + list(statuses)).fetchall()
+    db.close()
+
+    return [__job__(row) for row in rows]
+
+#******************************************
+def take(path, chamber):
+    """Take the next queued job of a climate chamber and mark it as running.
+
+    Return the job, or None if the queue is empty.
+    """
+
+    db = connect(path)
+    with db:
+        db.execute("BEGIN IMMEDIATE")
+        row = db.execute(
+            "SELECT * FROM jobs WHERE chamber = ? AND status = ? ORDER BY priority, rank LIMIT 1",
+            (chamber, QUEUED)).fetchone()
+        if row is not None:
+            db.execute("UPDATE jobs SET status = ?, started = ? WHERE id = ?", (RUNNING, time.time(), row["id"]))
+            row = db.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone()
+    db.close()
+
+    return __job__(row) if row is not None else None
+
+#******************************************
+def finish(path, job, status=DONE):
+    """Mark a running job as done or interrupted."""
+
+    db = connect(path)
+    with db:
+        db.execute("UPDATE jobs SET status = ?, ended = ? WHERE id = ? AND status = ?", (status, time.time(), job, RUNNING))
+    db.close()
+
+    return
+
+#******************************************
+def interrupt(path, chamber):
+    """Mark the running jobs of a climate chamber as interrupted (e.g. after killing the program process)."""
+
+    db = connect(path)
+    with db:
+        db.execute("UPDATE jobs SET status = ?, ended = ? WHERE chamber = ? AND status = ?", (INTERRUPTED, time.time(), chamber, RUNNING))
+    db.close()
+
+    return
+
+#******************************************
+def cancel(path, job):
+    """Remove a queued job from the queue.
+
+    Return whether the job was cancelled.
+    """
+
+    db = connect(path)
+    with db:
+        cancelled = db.execute("UPDATE jobs SET status = ?, ended = ? WHERE id = ? AND status = ?", (CANCELLED, time.time(), job, QUEUED)).rowcount == 1
+    db.close()
+
+    return cancelled
+
+#******************************************
+def prioritize(path, job, priority):
+    """Change the priority of a queued job (lowest first)."""
+
+    db = connect(path)
+    with db:
+        db.execute("UPDATE jobs SET priority = ? WHERE id = ? AND status = ?", (priority, job, QUEUED))
+    db.close()
+
+    return
+
+#******************************************
+def move(path, job, offset):
+    """Move a queued job up (negative offset) or down (positive offset) among the queued jobs with the same priority.
+
+    Return whether the job was moved.
+    """
+
+    db = connect(path)
+    with db:
+        db.execute("BEGIN IMMEDIATE")
+        row = db.execute("SELECT chamber, priority FROM jobs WHERE id = ? AND status = ?", (job, QUEUED)).fetchone()
+        moved = False
+        if row is not None:
+
+            #queued jobs with the same priority, in order
+            queue = db.execute(
+                "SELECT id, rank FROM jobs WHERE chamber = ? AND status = ? AND priority = ? ORDER BY rank",
+                (row["chamber"], QUEUED, row["priority"])).fetchall()
+            ids = [other["id"] for other in queue]
+
+            #NOTE the jobs keep their ranks in order, only the order of the jobs changes
+            ii = ids.index(job)
+            jj = min(max(ii + offset, 0), len(ids) - 1)
+            ids.insert(jj, ids.pop(ii))
+            db.executemany("UPDATE jobs SET rank = ? WHERE id = ?", zip([other["rank"] for other in queue], ids))
+            moved = jj != ii
+    db.close()
+
+    return moved
+
+#******************************************
+def describe(job):
+    """Describe a job in one line."""
+
+    cycle = job["parameters"]["cycle"]
+    description = "%s: %s (%s times between %s C (%s') and %s C (%s'), finally %s C (%s'))"%(
+        job["id"],
+        job["program"] if job["program"] != "" else "ad hoc",
+        *["%g"%value for value in cycle])
+    if job["priority"] != 0:
+        description += ", priority %s"%job["priority"]
+
+    return description
+
+#******************************************
+def run(path, ccc, refresh=2.0, verbose=False, force=False, callback=None):
+    """Run the queued jobs of a climate chamber back to back until the queue is empty.
+
+    An optional callback factory, called as callback(job), returns the program callback of each job.
+    The queue stops at the first interrupted job, or before the next job if the climate chamber is busy and not forced.
+    NOTE the caller must make sure that no other program is running on the climate chamber (e.g. by holding the GUI lock or a lease).
+    """
+
+    while True:
+        if not force and not ccc.isAvailable(verbose):
+            logging.warning("the climate chamber is currently busy, will not run the queued programs")
+            return
+        job = take(path, ccc.chamber)
+        if job is None:
+            return
+
+        arglist, tolerance, rate, variables, dryair = cycleArguments(job)
+        try:
+            output = ccc.cycle(arglist, tolerance, refresh, verbose, force, rate, callback(job) if callback is not None else None, variables, dryair)
+        except:
+            finish(path, job["id"], INTERRUPTED)
+            raise
+        finish(path, job["id"], DONE if output[0] == "1" else INTERRUPTED)
+        if output[0] != "1":
+            return
+
+#******************************************
+if __name__ == "__main__":
+
+    #------------------------------------------
+    #import stuff
+    import argparse, configparser, os, signal, sys
+    import climatechambercontroller
+
+    #------------------------------------------
+    #input arguments
+    parser = argparse.ArgumentParser(description="queue thermal cycling programs on a climate chamber")
+    parser.add_argument("queue", type=str, help="queue database")
+    parser.add_argument("-a", "--address", dest="address", type=str, required=True, help="climate chamber address")
+    parser.add_argument("-p", "--port", dest="port", type=int, required=False, default=2049, help="climate chamber port")
+    parser.add_argument("-i", "--id", dest="id", type=int, required=False, default=1, help="climate chamber ID")
+    parser.add_argument("-t", "--tolerance", dest="tolerance", type=float, required=False, default=0.1, help="temperature tolerance [C] of ad hoc programs")
+    parser.add_argument("-r", "--refresh", dest="refresh", type=float, required=False, default=2.0, help="refresh interval [s]")
+    parser.add_argument("--rate", dest="rate", type=float, required=False, default=0., help="ramp rate [C/minute] of ad hoc programs")
+    parser.add_argument("--priority", dest="priority", type=int, required=False, default=0, help="priority of the added program (lowest first)")
+    parser.add_argument("--programs", dest="programs", type=str, required=False, default="programs.conf", help="programs file")
+    parser.add_argument("--dryair", dest="dryair", type=int, required=False, default=None, help="dry air channel of programs with dry_air_below")
+    parser.add_argument("-v", "--verbose", dest="verbose", action="store_true", default=False, help="verbose mode")
+    parser.add_argument("-f", "--force", dest="force", action="store_true", default=False, help="force command")
+    parser.add_argument("--lock", dest="lock", type=str, required=False, default="lock", help="lock file of the programs run on this host (the same as the GUI one)")
+    parser.add_argument("--lease", dest="lease", type=str, required=False, default=None, help="lease database (SQLite) on storage shared by the controller hosts")
+    command_parser = parser.add_mutually_exclusive_group(required=True)
+    command_parser.add_argument("--list", dest="list", action="store_true", default=False, help="list the queued and running programs")
+    command_parser.add_argument("--add", dest="add", type=str, default=None, help="add a program from the programs file")
+    command_parser.add_argument("--cycle", dest="cycle", nargs=7, default=None, help="add an ad hoc program: n, t1 [C], i1 ['], t2 [C], i2 ['], t3 [C], i3 [']")
+    command_parser.add_argument("--cancel", dest="cancel", type=int, default=None, help="cancel a queued program")
+    command_parser.add_argument("--up", dest="up", type=int, default=None, help="move a queued program up")
+    command_parser.add_argument("--down", dest="down", type=int, default=None, help="move a queued program down")
+    command_parser.add_argument("--reprioritize", dest="reprioritize", type=int, default=None, help="change the priority of a queued program to --priority")
+    command_parser.add_argument("--run", dest="run", action="store_true", default=False, help="run the queued programs back to back")
+    args = parser.parse_args()
+    chamber = "%s:%s/%s"%(args.address, args.port, args.id)
+
+    #------------------------------------------
+    #list
+    if args.list:
+        for job in jobs(args.queue, chamber):
+            print("%s%s"%(describe(job), " [running]" if job["status"] == RUNNING else ""))
+
+    #------------------------------------------
+    #add from the programs file
+    elif args.add is not None:
+        programs = configparser.ConfigParser()
+        programs.read(args.programs)
+        if not programs.has_section(args.add):
+            parser.error("program not found: %s"%args.add)
+        print("queued: %s"%enqueue(args.queue, chamber, args.add, fromProgram(programs[args.add], args.dryair), args.priority))
+
+    #------------------------------------------
+    #add an ad hoc program
+    elif args.cycle is not None:
+        print("queued: %s"%enqueue(args.queue, chamber, "", parameters(args.cycle, args.tolerance, args.rate), args.priority))
+
+    #------------------------------------------
+    #reorder
+    elif args.cancel is not None:
+        if not cancel(args.queue, args.cancel):
+            logging.error("program %s is not queued"%args.cancel)
+    elif args.up is not None or args.down is not None:
+        if not move(args.queue, args.up if args.up is not None else args.down, -1 if args.up is not None else 1):
+            logging.error("program %s not moved"%(args.up if args.up is not None else args.down))
+    elif args.reprioritize is not None:
+        prioritize(args.queue, args.reprioritize, args.priority)
+
+    #------------------------------------------
+    #run
+    #NOTE the queue is run holding the same lock as the GUI programs, and optionally a lease
+    elif args.run:
+        import fasteners
+
+        #lock
+        lock = fasteners.InterProcessLock(args.lock)
+        if not lock.acquire(blocking=False):
+            logging.error("a program is currently running on this host (%s), will not run the queued programs"%args.lock)
+            sys.exit(1)
+        with open(args.lock, "w") as f:
+            f.write(str(os.getpid()) + "\n")
+            f.write("queued programs")
+
+        #lease
+        owner = None
+        if args.lease is not None:
+            import lease
+            owner = lease.lease(args.lease, args.address, args.port, args.id)
+            if not owner.acquire(args.force):
+                holder = owner.holder()
+                logging.error("the climate chamber is leased%s"%(" by %s until %s"%(holder[0], time.ctime(holder[1])) if holder is not None else ""))
+                lock.release()
+                sys.exit(1)
+
+        #stop gracefully when terminated
+        #NOTE the running program stops the climate chamber and its job is marked as interrupted
+        def interrupt(signum, frame):
+            raise KeyboardInterrupt("queue terminated")
+        signal.signal(signal.SIGTERM, interrupt)
+
+        try:
+            run(args.queue, climatechambercontroller.climatechambercontroller(args.address, args.port, args.id), args.refresh, args.verbose, args.force,
+                (lambda job: owner.callback) if owner is not None else None)
+        finally:
+            if owner is not None:
+                owner.release()
+                owner.close()
+            with open(args.lock, "w") as f:
+                f.truncate(0)
+            lock.release()
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+
+#******************************************
+#An indexed history of thermal cycling programs with per-run and per-step summaries.
+
+#******************************************
+__author__ = "Francesco Guescini"
+__version__ = "0.0.0"
+
+#******************************************
+#import stuff
+import json, logging, math, sqlite3, time
+
+#******************************************
+#database schema
+#NOTE the per-run summary columns are updated at the end of each step, so that queries never scan the steps
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    name TEXT,
+    chamber TEXT,
+    program TEXT,
+    parameters TEXT,
+    start REAL,
+    end REAL,
+    status TEXT,
+    steps INTEGER DEFAULT 0,
+    max_overshoot REAL DEFAULT 0,
+    max_time_to_target REAL DEFAULT 0,
+    max_dwell_std REAL DEFAULT 0);
+CREATE INDEX IF NOT EXISTS runs_name ON runs (name, start);
+CREATE INDEX IF NOT EXISTS runs_chamber ON runs (chamber, start);
+CREATE INDEX IF NOT EXISTS runs_program ON runs (program, start);
+CREATE INDEX IF NOT EXISTS runs_start ON runs (start);
+CREATE TABLE IF NOT EXISTS steps (
+    run INTEGER REFERENCES runs (id),
+    cycle INTEGER,
+    step INTEGER,
+    setpoint REAL,
+    start REAL,
+    time_to_target REAL,
+    overshoot REAL,
+    dwell_n INTEGER,
+    dwell_mean REAL,
+    dwell_std REAL,
+    dwell_min REAL,
+    dwell_max REAL,
+    PRIMARY KEY (run, cycle, step));
+"""
+
+#******************************************
+def connect(path):
+    """Open the history database, creating it if needed."""
+
+    db = sqlite3.connect(path, timeout=10.)
+    db.row_factory = sqlite3.Row
+    db.executescript(SCHEMA)
+
+    return db
+
+#******************************************
+class recorder:
+    """Record a thermal cycling program in the history database.
+
+    The per-step aggregates (time to target, overshoot, dwell mean and standard deviation) are computed incrementally from the program events.
+    """
+
+    #******************************************
+    def __init__(self, path, chamber, name="", program="", parameters=None, clock=None):
+        """Initialize the recorder.
+
+        chamber identifies the climate chamber (address:port/ID), name is an optional human-readable name (e.g. the ccc.conf section).
+        """
+
+        self.path = path
+        self.chamber = chamber
+        self.name = name if name != "" else chamber
+        self.program = program
+        self.parameters = parameters if parameters is not None else {}
+        self.clock = clock if clock is not None else time
+        self.db = None
+        self.run = None
+        self.current = None
+
+        return
+
+    #******************************************
+    def __begin__(self):
+        """Insert the run."""
+
+        self.db = connect(self.path)
+        with self.db:
+            self.run = self.db.execute(
+                "INSERT INTO runs (name, chamber, program, parameters, start, status) VALUES (?, ?, ?, ?, ?, 'running')",
+                (self.name, self.chamber, self.program, json.dumps(self.parameters), self.clock.time())).lastrowid
+
+        return
+
+    #******************************************
+    def __startStep__(self, cycle, step, setpoint):
+        """Start the aggregates of a new step."""
+
+        self.current = {
+            "cycle": cycle,
+            "step": step,
+            "setpoint": setpoint,
+            "start": self.clock.time(),
+            "direction": 0.,
+            "time_to_target": None,
+            "overshoot": 0.,
+            "n": 0,
+            "mean": 0.,
+            "m2": 0.,
+            "min": None,
+            "max": None}
+
+        return
+
+    #******************************************
+    def __reading__(self, actual):
+        """Update the aggregates of the current step."""
+
+        step = self.current
+        if step is None:
+            return
+
+        #NOTE the direction of the ramp is taken from the first reading
+        if step["direction"] == 0.:
+            step["direction"] = 1. if step["setpoint"] >= actual else -1.
+
+        #overshoot beyond the setpoint in the direction of the ramp
+        step["overshoot"] = max(step["overshoot"], step["direction"]*(actual - step["setpoint"]))
+
+        #dwell mean and standard deviation (Welford)
+        if step["time_to_target"] is not None:
+            step["n"] += 1
+            delta = actual - step["mean"]
+            step["mean"] += delta/step["n"]
+            step["m2"] += delta*(actual - step["mean"])
+            step["min"] = actual if step["min"] is None else min(step["min"], actual)
+            step["max"] = actual if step["max"] is None else max(step["max"], actual)
+
+        return
+
+    #******************************************
+    def __endStep__(self):
+        """Store the aggregates of the current step and update the run summary."""
+
+        step = self.current
+        if step is None:
+            return
+        self.current = None
+        if self.run is None:
+            return
+
+        std = math.sqrt(step["m2"]/step["n"]) if step["n"] > 0 else None
+        with self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO steps VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (self.run, step["cycle"], step["step"], step["setpoint"], step["start"], step["time_to_target"], step["overshoot"],
+                 step["n"], step["mean"] if step["n"] > 0 else None, std, step["min"], step["max"]))
+            self.db.execute(
+                "UPDATE runs SET steps = steps + 1, max_overshoot = MAX(max_overshoot, ?), max_time_to_target = MAX(max_time_to_target, ?), max_dwell_std = MAX(max_dwell_std, ?) WHERE id = ?",
+                (step["overshoot"], step["time_to_target"] or 0., std or 0., self.run))
+
+        return
+
+    #******************************************
+    def callback(self, event, **fields):
+        """Record climatechambercontroller.cycle events."""
+
+        try:
+            if event == "program":
+                self.__begin__()
+            elif event == "step":
+                self.__endStep__()
+                self.__startStep__(fields["cycle"], fields["step"], fields["setpoint"])
+            elif event == "reading":
+                self.__reading__(fields["actual"])
+            elif event == "dwell" and self.current is not None and self.current["time_to_target"] is None:
+                self.current["time_to_target"] = self.clock.time() - self.current["start"]
+            #NOTE nothing is recorded if the run could not be inserted
+            elif event == "end" and self.db is not None:
+                if self.run is not None:
+                    self.__endStep__()
+                    with self.db:
+                        self.db.execute("UPDATE runs SET end = ?, status = ? WHERE id = ?",
+                            (self.clock.time(), "interrupted" if fields.get("interrupted") else "completed", self.run))
+                self.db.close()
+
+        #NOTE the history must never stop a program
+        except sqlite3.Error as e:
+            logging.error("there was an error while recording the program history: %s"%e)
+
+        return None
+
+#******************************************
+def interrupt(path, chamber):
+    """Mark the runs still running on a climate chamber as interrupted (e.g. after killing the program process)."""
+
+    db = connect(path)
+    with db:
+        db.execute("UPDATE runs SET end = ?, status = 'interrupted' WHERE chamber = ? AND status = 'running'", (time.time(), chamber))
+    db.close()
+
+    return
+
+#******************************************
+def query(path, name=None, program=None, since=None, until=None, limit=100):
+    """Query the runs by climate chamber (name or address:port/ID), program and start time [s].
+
+    Return the most recent runs first, with their summaries.
+    """
+
+    conditions, values = [], []
+    if name is not None:
+        conditions.append("(name = ? OR chamber = ?)")
+        values += [name, name]
+    if program is not None:
+        conditions.append("program = ?")
+        values.append(program)
+    if since is not None:
+        conditions.append("start >= ?")
+        values.append(since)
+    if until is not None:
+        conditions.append("start < ?")
+        values.append(until)
+
+    db = connect(path)
+    rows = db.execute(
+        "SELECT * FROM runs%s ORDER BY start DESC LIMIT ?"%(" WHERE " + " AND ".join(conditions) if len(conditions) > 0 else ""),
+        values + [limit]).fetchall()
+    db.close()
+
+    return [dict(row) for row in rows]
+
+#******************************************
+def steps(path, run):
+    """Get the step summaries of a run."""
+
+    db = connect(path)
+    rows = db.execute("SELECT * FROM steps WHERE run = ? ORDER BY start", (run,)).fetchall()
+    db.close()
+
+    return [dict(row) for row in rows]
+
+#******************************************
+if __name__ == "__main__":
+
+    #------------------------------------------
+    #import stuff
+    import argparse, datetime
+
+    #------------------------------------------
+    #input arguments
+    parser = argparse.ArgumentParser(description="query the thermal cycling program history")
+    parser.add_argument("history", type=str, help="history database")
+    parser.add_argument("-c", "--chamber", dest="chamber", type=str, required=False, default=None, help="climate chamber name or address:port/ID")
+    parser.add_argument("-p", "--program", dest="program", type=str, required=False, default=None, help="program name")
+    parser.add_argument("--since", dest="since", type=str, required=False, default=None, help="start date (YYYY-MM-DD)")
+    parser.add_argument("--until", dest="until", type=str, required=False, default=None, help="end date (YYYY-MM-DD)")
+    parser.add_argument("-n", "--limit", dest="limit", type=int, required=False, default=100, help="maximum number of runs")
+    parser.add_argument("--steps", dest="steps", type=int, required=False, default=None, help="show the steps of a run")
+    args = parser.parse_args()
+
+    def timestamp(date):
+        return time.mktime(datetime.datetime.strptime(date, "%Y-%m-%d").timetuple()) if date is not None else None
+
+    def date(t):
+        return time.strftime("%Y-%m-%d %H:%M", time.localtime(t)) if t is not None else "-"
+
+    #------------------------------------------
+    #steps
+    if args.steps is not None:
+        for step in steps(args.history, args.steps):
+            print("cycle %s step %s: %.2f C, time to target %s, overshoot %.2f C, dwell %s"%(
+                step["cycle"],
+                step["step"],
+                step["setpoint"],
+                "%.1f'"%(step["time_to_target"]/60.) if step["time_to_target"] is not None else "-",
+                step["overshoot"],
+                "%.2f +- %.2f C"%(step["dwell_mean"], step["dwell_std"]) if step["dwell_n"] > 0 else "-"))
+
+    #------------------------------------------
+    #runs
+    else:
+        for run in query(args.history, args.chamber, args.program, timestamp(args.since), timestamp(args.until), args.limit):
+            print("%s | %s | %s | %s - %s | %s | %s steps | max overshoot %.2f C"%(
+                run["id"],
+                run["name"],
+                run["program"],
+                date(run["start"]),
+                date(run["end"]),
+                run["status"],
+                run["steps"],
+                run["max_overshoot"]))
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+
+#******************************************
+#A per-chamber request scheduler for the Climate Chamber Controller.
+
+#******************************************
+__author__ = "Francesco Guescini"
+__version__ = "0.0.0"
+
+#******************************************
+#import stuff
+import heapq, itertools, threading, time
+from concurrent.futures import Future
+import climatechambercontroller
+
+#******************************************
+#priorities (lowest first)
+PRIORITY_STOP = 0
+PRIORITY_WRITE = 1
+PRIORITY_READ = 2
+
+#maximum number of requests pipelined over the connection at once
+BATCH = 8
+
+#******************************************
+#one scheduler per climate chamber
+__schedulers__ = {}
+__lock__ = threading.Lock()
+
+#******************************************
+def getScheduler(address, port, id, rate=0., burst=5, trace=None):
+    """Get the scheduler of a climate chamber, creating it if needed."""
+
+    with __lock__:
+        key = (address, port, str(id))
+        if key not in __schedulers__:
+            __schedulers__[key] = scheduler(address, port, id, rate, burst, trace)
+        return __schedulers__[key]
+
+#******************************************
+def priority(arglist):
+    """Get the priority of a SIMSERV command."""
+
+    #NOTE stopping the climate chamber (digital channel 1 to 0) jumps the queue
+    if arglist[0] == climatechambercontroller.SET_CHANNEL and list(arglist[2:]) == ["1", "0"]:
+        return PRIORITY_STOP
+
+    command = climatechambercontroller.COMMANDS.get(arglist[0])
+    if command is not None and command.readonly:
+        return PRIORITY_READ
+
+    return PRIORITY_WRITE
+
+#******************************************
+class scheduler:
+    """Serialize the requests sent to a climate chamber.
+
+    Requests are queued by priority and sent by a single worker thread over a persistent connection.
+    Identical readonly requests waiting in the queue are coalesced into one.
+    A token bucket caps the request rate seen by the climate chamber; stop requests are not limited.
+    """
+
+    #******************************************
+    def __init__(self, address, port, id, rate=0., burst=5, trace=None):
+        """Initialize the scheduler and start its worker thread.
+
+        The rate is measured in requests per second; 0 means no limit.
+        """
+
+        #controller used by the worker thread only
+        self.ccc = climatechambercontroller.climatechambercontroller(address, port, id, trace, persistent=True)
+
+        #queue
+        self.queue = []
+        self.pending = {}
+        self.counter = itertools.count()
+        self.condition = threading.Condition()
+
+        #token bucket
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.last = time.monotonic()
+
+        #worker
+        self.thread = threading.Thread(target=self.__work__, daemon=True)
+        self.thread.start()
+
+        return
+
+    #******************************************
+    def submit(self, arglist, verbose=False):
+        """Queue a command and return a future for its output."""
+
+        arglist = [str(arg) for arg in arglist]
+        key = tuple(arglist)
+        p = priority(arglist)
+
+        with self.condition:
+
+            #coalesce identical readonly requests
+            #NOTE only with those still queued: a request already sent may have been answered before a write queued since
+            if p == PRIORITY_READ and key in self.pending:
+                return self.pending[key]
+
+            future = Future()
+            if p == PRIORITY_READ:
+                self.pending[key] = future
+            heapq.heappush(self.queue, (p, next(self.counter), arglist, verbose, future))
+            self.condition.notify()
+
+        return future
+
+    #******************************************
+    def send(self, arglist, verbose=False):
+        """Send a command and wait for its output."""
+        return self.submit(arglist, verbose).result()
+
+    #******************************************
+    def __take__(self, p):
+        """Take a token from the bucket, waiting if needed."""
+
+        if self.rate <= 0 or p == PRIORITY_STOP:
+            return
+
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.last)*self.rate)
+            self.last = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            time.sleep((1 - self.tokens)/self.rate)
+
+    #******************************************
+    def __work__(self):
+        """Send the queued requests."""
+
+        while True:
+
+            #------------------------------------------
+            #wait for requests
+            with self.condition:
+                while len(self.queue) == 0:
+                    self.condition.wait()
+
+                #NOTE stop requests are always sent on their own
+                batch = [heapq.heappop(self.queue)]
+                while batch[0][0] != PRIORITY_STOP and len(self.queue) > 0 and len(batch) < BATCH:
+                    batch.append(heapq.heappop(self.queue))
+
+                #the requests taken are no longer queued
+                for p, _, arglist, _, _ in batch:
+                    if p == PRIORITY_READ:
+                        self.pending.pop(tuple(arglist), None)
+
+            #------------------------------------------
+            #send
+            for p, _, _, _, _ in batch:
+                self.__take__(p)
+            try:
+                outputs = self.ccc.sendBatch([arglist for _, _, arglist, _, _ in batch], any(verbose for _, _, _, verbose, _ in batch))
+                error = None
+            except BaseException as e:
+                error = e
+
+            #------------------------------------------
+            #results
+            for ii, (_, _, _, _, future) in enumerate(batch):
+                if error is None:
+                    future.set_result(outputs[ii])
+                else:
+                    future.set_exception(error)
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+
+#******************************************
+#Live program state shared between the program runner and the GUI.
+
+#******************************************
+__author__ = "Francesco Guescini"
+__version__ = "0.0.0"
+
+#******************************************
+#import stuff
+import os, re, struct, time
+from multiprocessing import shared_memory
+
+#******************************************
+#state layout
+#sequence number, followed by:
+#PID, cycle, number of cycles, step, phase, setpoint [C], actual temperature [C], update time [s], dwell deadline [s]
+SEQUENCE = struct.Struct("<Q")
+STATE = struct.Struct("<iiiiidddd")
+FIELDS = ["pid", "cycle", "ncycles", "step", "phase", "setpoint", "actual", "updated", "deadline"]
+SIZE = SEQUENCE.size + STATE.size
+
+#phases
+IDLE = 0
+RAMP = 1
+DWELL = 2
+DONE = 3
+PHASES = {IDLE: "idle", RAMP: "ramp", DWELL: "dwell", DONE: "done"}
+
+#******************************************
+def name(address, port, id):
+    """Shared memory block name of a climate chamber."""
+    return "ccc_" + re.sub("[^0-9A-Za-z]", "_", "%s_%s_%s"%(address, port, id))
+
+#******************************************
+class sharedstate:
+    """Program state in a shared memory block with seqlock-style versioning.
+
+    The writer makes the sequence number odd while updating the state and even again when done.
+    Readers retry until they read the same even sequence number before and after the state.
+    """
+
+    #******************************************
+    def __init__(self, name, create=False):
+        """Create or attach to the shared memory block."""
+
+        #NOTE an existing block (e.g. left over by a previous GUI instance) is reused
+        if create:
+            try:
+                self.memory = shared_memory.SharedMemory(name, create=True, size=SIZE)
+                self.memory.buf[:SIZE] = bytes(SIZE)
+            except FileExistsError:
+                self.memory = shared_memory.SharedMemory(name)
+        else:
+            self.memory = shared_memory.SharedMemory(name)
+
+        self.values = dict(zip(FIELDS, STATE.unpack_from(self.memory.buf, SEQUENCE.size)))
+
+        return
+
+    #******************************************
+    def write(self, **fields):
+        """Update some of the state fields."""
+
+        self.values.update(fields)
+        self.values["updated"] = time.time()
+
+        sequence = SEQUENCE.unpack_from(self.memory.buf, 0)[0]
+        SEQUENCE.pack_into(self.memory.buf, 0, sequence + 1)
+        STATE.pack_into(self.memory.buf, SEQUENCE.size, *[self.values[field] for field in FIELDS])
+        SEQUENCE.pack_into(self.memory.buf, 0, sequence + 2)
+
+        return
+
+    #******************************************
+    def read(self, retries=100):
+        """Read a consistent copy of the state.
+
+        Return None if the writer kept updating it during all retries.
+        """
+
+        for ii in range(retries):
+            before = SEQUENCE.unpack_from(self.memory.buf, 0)[0]
+            if before%2 == 1:
+                continue
+            values = STATE.unpack_from(self.memory.buf, SEQUENCE.size)
+            if SEQUENCE.unpack_from(self.memory.buf, 0)[0] == before:
+                return dict(zip(FIELDS, values))
+
+        return None
+
+    #******************************************
+    def callback(self, event, **fields):
+        """Update the state from climatechambercontroller.cycle events."""
+
+        if event == "program":
+            self.write(pid=os.getpid(), cycle=0, ncycles=fields["ncycles"], step=0, phase=IDLE, setpoint=0., actual=0., deadline=0.)
+        elif event == "step":
+            self.write(cycle=fields["cycle"], step=fields["step"], phase=RAMP, setpoint=fields["setpoint"], deadline=0.)
+        elif event == "reading":
+            self.write(**{field: fields[field] for field in ["actual", "setpoint"] if field in fields})
+        elif event == "dwell":
+            self.write(phase=DWELL, deadline=fields["deadline"])
+        elif event == "end":
+            self.write(phase=DONE, deadline=0.)
+
+        return
+
+    #******************************************
+    def close(self):
+        """Detach from the shared memory block."""
+        self.memory.close()
+        return
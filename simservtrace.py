@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+
+#******************************************
+#A module to trace SIMSERV exchanges and replay them through a stand-in server.
+
+#******************************************
+__author__ = "Francesco Guescini"
+__version__ = "0.0.0"
+
+#******************************************
+#import stuff
+import atexit, json, logging, queue, socketserver, sys, threading, time
+from collections import defaultdict, deque
+import climatechambercontroller
+
+#******************************************
+class tracer:
+    """Write every SIMSERV request and response to a JSONL trace file.
+
+    Records are handed to a background thread through a queue so that the caller never waits for the disk.
+    Each line holds the request time, the latency [s], the chamber, the request and the response.
+    """
+
+    #******************************************
+    def __init__(self, path):
+        """Open the trace file and start the writer thread."""
+
+        self.path = path
+        self.queue = queue.SimpleQueue()
+        self.thread = threading.Thread(target=self.__write__, daemon=True)
+        self.thread.start()
+
+        #make sure queued records reach the disk
+        atexit.register(self.close)
+
+        return
+
+    #******************************************
+    def record(self, chamber, timestamp, latency, request, response):
+        """Queue one exchange."""
+        self.queue.put((chamber, timestamp, latency, request, response))
+        return
+
+    #******************************************
+    def __write__(self):
+        """Write queued records to the trace file."""
+
+        #NOTE line buffering keeps lines whole when several processes append to the same file
+        with open(self.path, "a", buffering=1) as f:
+            while True:
+                item = self.queue.get()
+                if item is None:
+                    break
+
+                #NOTE an event is set once the records queued before it have been written
+                if isinstance(item, threading.Event):
+                    f.flush()
+                    item.set()
+                    continue
+
+                chamber, timestamp, latency, request, response = item
+                f.write(json.dumps({
+                    "t": round(timestamp, 6),
+                    "latency": round(latency, 6),
+                    "chamber": chamber,
+                    "request": list(request),
+                    "response": list(response)}) + "\n")
+
+        return
+
+    #******************************************
+    def flush(self, timeout=1.0):
+        """Wait until the records queued so far have been written to the trace file."""
+
+        if self.thread.is_alive():
+            done = threading.Event()
+            self.queue.put(done)
+            done.wait(timeout)
+
+        return
+
+    #******************************************
+    def callback(self, event, **fields):
+        """Flush the trace at each step and at the end of a climatechambercontroller.cycle program.
+
+        NOTE processes ended with os._exit (e.g. multiprocessing children) do not run the atexit hook.
+        """
+
+        if event in ["step", "end"]:
+            self.flush()
+
+        return None
+
+    #******************************************
+    def close(self):
+        """Flush the queue and stop the writer thread."""
+
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+
+        return
+
+#******************************************
+def load(path):
+    """Load a trace file."""
+    with open(path, "r") as f:
+        return [json.loads(line) for line in f if line.strip() != ""]
+
+#******************************************
+class standin(socketserver.ThreadingTCPServer):
+    """A stand-in SIMSERV server answering with the responses recorded in a trace.
+
+    Responses to the same request are returned in the recorded order.
+    Once they are exhausted, the last one is repeated.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    #******************************************
+    def __init__(self, records, address="localhost", port=0):
+        """Index the recorded responses and bind the server."""
+
+        self.responses = defaultdict(deque)
+        self.last = {}
+        self.lock = threading.Lock()
+        for record in records:
+            self.responses[tuple(record["request"])].append(record["response"])
+
+        socketserver.ThreadingTCPServer.__init__(self, (address, port), standinhandler)
+
+        return
+
+    #******************************************
+    def respond(self, request):
+        """Get the response to a request."""
+
+        key = tuple(request)
+        with self.lock:
+            if len(self.responses[key]) > 0:
+                self.last[key] = self.responses[key].popleft()
+
+            #NOTE unknown commands are answered with an unknown command ID error
+            return self.last.get(key, ["-5"])
+
+#******************************************
+class standinhandler(socketserver.StreamRequestHandler):
+    """Answer SIMSERV requests until the client closes the connection."""
+
+    #******************************************
+    def handle(self):
+        buffer = b""
+        while True:
+            data = self.request.recv(512)
+            if not data:
+                break
+            buffer += data
+
+            #answer every complete request
+            while climatechambercontroller.CR in buffer:
+                commandstring, buffer = buffer.split(climatechambercontroller.CR, 1)
+
+                #NOTE the command string starts with a delimiter
+                request = [item.decode().strip() for item in commandstring.split(climatechambercontroller.DELIM)][1:]
+                response = self.server.respond(request)
+                self.request.sendall(climatechambercontroller.DELIM.join(item.encode("ascii") for item in response) + b"\r\n")
+
+#******************************************
+def replay(records, address, port, speed=1.0, verbose=False):
+    """Send the requests in a trace to a server, keeping the recorded timing.
+
+    The timing is accelerated by the speed factor; a speed of 0 sends the requests as fast as possible.
+    Return the number of requests, the number of responses differing from the recorded ones and the latencies [s].
+    """
+
+    #one controller per recorded chamber ID
+    controllers = {}
+
+    mismatches = 0
+    latencies = []
+    start = time.time()
+    for record in records:
+
+        #wait for the (scaled) recorded time
+        if speed > 0:
+            delay = (record["t"] - records[0]["t"])/speed - (time.time() - start)
+            if delay > 0:
+                time.sleep(delay)
+
+        #send
+        id = record["chamber"].rsplit("/", 1)[-1]
+        if id not in controllers:
+            controllers[id] = climatechambercontroller.climatechambercontroller(address, port, id)
+        t0 = time.perf_counter()
+        response = controllers[id].send(record["request"], verbose)
+        latencies.append(time.perf_counter() - t0)
+
+        if response != record["response"]:
+            mismatches += 1
+            if verbose:
+                logging.warning("response mismatch: %s != %s"%(" ".join(response), " ".join(record["response"])))
+
+    return len(records), mismatches, latencies
+
+#******************************************
+if __name__ == "__main__":
+
+    #------------------------------------------
+    #import stuff
+    import argparse
+
+    #------------------------------------------
+    #logging setup
+    logging.basicConfig(format="%(levelname)s %(message)s", level=logging.INFO)
+
+    #------------------------------------------
+    #input arguments
+    parser = argparse.ArgumentParser(description="replay a SIMSERV trace")
+    parser.add_argument("trace", type=str, help="trace file")
+    parser.add_argument("-a", "--address", dest="address", type=str, required=False, default=None, help="server address (default: start a stand-in server)")
+    parser.add_argument("-p", "--port", dest="port", type=int, required=False, default=2049, help="server port (the internal stand-in server uses a free port)")
+    parser.add_argument("-s", "--speed", dest="speed", type=float, required=False, default=1.0, help="replay speed factor (0: as fast as possible)")
+    parser.add_argument("--serve", dest="serve", action="store_true", default=False, help="only run the stand-in server")
+    parser.add_argument("-v", "--verbose", dest="verbose", action="store_true", default=False, help="verbose mode")
+    args = parser.parse_args()
+
+    #------------------------------------------
+    #load trace
+    records = load(args.trace)
+    if len(records) == 0:
+        logging.error("the trace is empty")
+        sys.exit(1)
+
+    #------------------------------------------
+    #stand-in server only
+    if args.serve:
+        server = standin(records, args.address or "localhost", args.port)
+        logging.info("serving on %s:%s"%server.server_address[:2])
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        sys.exit(0)
+
+    #------------------------------------------
+    #start a stand-in server if no address is given
+    address, port = args.address, args.port
+    if address is None:
+        server = standin(records)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        address, port = server.server_address[:2]
+
+    #------------------------------------------
+    #replay
+    start = time.time()
+    n, mismatches, latencies = replay(records, address, port, args.speed, args.verbose)
+    latencies.sort()
+    print("requests: %s"%n)
+    print("mismatches: %s"%mismatches)
+    print("duration: %.3f s (recorded: %.3f s)"%(time.time() - start, records[-1]["t"] - records[0]["t"]))
+    print("latency: mean %.2f ms, median %.2f ms, max %.2f ms"%(
+        1e3*sum(latencies)/n,
+        1e3*latencies[n//2],
+        1e3*latencies[-1]))
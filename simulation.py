@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+
+#******************************************
+#A simulated climate chamber and virtual clock to dry-run thermal cycling programs.
+
+#******************************************
+__author__ = "Francesco Guescini"
+__version__ = "0.0.0"
+
+#******************************************
+#import stuff
+import math
+import climatechambercontroller, thermalmodel, anomaly
+
+#******************************************
+class virtualclock:
+    """A clock that advances only when sleeping."""
+
+    #******************************************
+    def __init__(self, start=0.):
+        self.now = start
+        return
+
+    #******************************************
+    def time(self):
+        return self.now
+
+    #******************************************
+    def sleep(self, seconds):
+        self.now += max(0., seconds)
+        return
+
+#******************************************
+class simulatedchamber(climatechambercontroller.climatechambercontroller):
+    """A climate chamber controller answering SIMSERV commands from a thermal model instead of the network.
+
+    The actual temperature follows the model while the climate chamber is running (digital channel 1 on).
+    NOTE the other control variables (e.g. humidity) are not modelled and reach their nominal values right away.
+    Every command is recorded with its (virtual) time and output, and every program step with its ramp and dwell durations.
+    """
+
+    #******************************************
+    def __init__(self, model=None, temperature=20., clock=None, id=1):
+        """Initialize the simulated climate chamber."""
+
+        climatechambercontroller.climatechambercontroller.__init__(self, "simulation", 0, id, clock=clock if clock is not None else virtualclock())
+
+        self.model = model if model is not None else thermalmodel.thermalmodel()
+        self.actual = temperature
+        self.nominal = temperature
+        self.channels = {}
+        self.values = {}
+        self.updated = self.clock.time()
+        self.commands = []
+        self.timeline = []
+
+        return
+
+    #******************************************
+    def __advance__(self):
+        """Advance the actual temperature to the current time."""
+
+        now = self.clock.time()
+        dt = now - self.updated
+        self.updated = now
+        if self.channels.get("1", 0) == 0:
+            return
+
+        #rate-limited phase, then first-order approach
+        while dt > 0:
+            error = self.nominal - self.actual
+            tau, rmax = (self.model.tau_heat, self.model.rate_heat) if error > 0 else (self.model.tau_cool, self.model.rate_cool)
+            if abs(error) > rmax*tau:
+                step = min(dt, (abs(error) - rmax*tau)/rmax)
+                self.actual += math.copysign(rmax*step, error)
+                dt -= step
+            else:
+                self.actual = self.nominal - error*math.exp(-dt/tau)
+                dt = 0.
+
+        return
+
+    #******************************************
+    def __respond__(self, arglist):
+        """Answer a SIMSERV command."""
+
+        #NOTE the first argument of the value commands is the control variable
+        command = arglist[0]
+        temperature = arglist[1] == str(climatechambercontroller.TEMPERATURE)
+        if command == climatechambercontroller.STATUS:
+            return ["1", "2" if self.channels.get("1", 0) else "1"]
+        elif command == climatechambercontroller.GET_ACTUAL:
+            return ["1", "%.2f"%(self.actual if temperature else self.values.get(arglist[1], 0.))]
+        elif command == climatechambercontroller.GET_NOMINAL:
+            return ["1", "%.2f"%(self.nominal if temperature else self.values.get(arglist[1], 0.))]
+        elif command == climatechambercontroller.SET_NOMINAL:
+            if temperature:
+                self.nominal = float(arglist[3])
+            else:
+                self.values[arglist[1]] = float(arglist[3])
+            return ["1"]
+        elif command == climatechambercontroller.GET_CHANNEL:
+            return ["1", str(self.channels.get(arglist[2], 0))]
+        elif command == climatechambercontroller.SET_CHANNEL:
+            self.channels[arglist[2]] = int(arglist[3])
+            return ["1"]
+
+        return ["-5"]
+
+    #******************************************
+    def __report__(self, event, **fields):
+        """Record the step timeline, then report the event to the callback, if any.
+
+        NOTE the program events are reported here even without a callback, so that recording them adds no traffic.
+        """
+
+        now = self.clock.time()
+        timeline = self.timeline
+
+        #NOTE a step ends when the next one starts
+        if event in ["step", "end"] and len(timeline) > 0:
+            timeline[-1][5] = now - timeline[-1][3] - timeline[-1][4]
+
+        if event == "step":
+            timeline.append([fields["cycle"], fields["step"], fields["setpoint"], now, 0., 0.])
+        elif event == "dwell":
+            timeline[-1][4] = now - timeline[-1][3]
+
+        return climatechambercontroller.climatechambercontroller.__report__(self, event, **fields)
+
+    #******************************************
+    def sendBatch(self, arglists, verbose=False):
+        """Answer the commands from the simulation."""
+
+        self.__advance__()
+        outputs = []
+        for arglist in arglists:
+            arglist = [str(arg) for arg in arglist]
+            error = climatechambercontroller.validate(arglist)
+            output = ["-6"] if error is not None else self.__respond__(arglist)
+            self.commands.append((self.clock.time(), arglist, output))
+            outputs.append(output)
+
+        return outputs
+
+#******************************************
+def dryRun(arglist, tolerance=0.1, refresh=2.0, rate=0., model=None, temperature=20., callback=None, detect=False, variables=None, dryair=None):
+    """Dry-run a thermal cycling program on a simulated climate chamber.
+
+    The program events are passed on to the optional callback and, if requested, to an anomaly detector.
+    NOTE the command sequence is the one of a run with the same callbacks: readings are only taken while dwelling if someone is listening.
+    Return the command sequence as (time [s], command, output),
+    the timeline as (cycle, step, setpoint [C], ramp start [s], ramp duration [s], dwell duration [s]) and the duration [s].
+    """
+
+    ccc = simulatedchamber(model, temperature)
+    if detect:
+        callback = climatechambercontroller.chain(callback, anomaly.detector(tolerance, clock=ccc.clock).callback)
+
+    #------------------------------------------
+    #run
+    ccc.cycle(arglist, tolerance, refresh, force=True, rate=rate, callback=callback, variables=variables, dryair=dryair)
+
+    return ccc.commands, [tuple(step) for step in ccc.timeline], ccc.clock.time()
@@ -0,0 +1,381 @@
+#!/usr/bin/env python3
+
+#******************************************
+#A compact archive of climate chamber time series with downsampled rollups.
+
+#******************************************
+__author__ = "Francesco Guescini"
+__version__ = "0.0.0"
+
+#******************************************
+#import stuff
+import logging, sqlite3, time
+import numpy as np
+
+#******************************************
+#quantization of time [s] and values (e.g. [C])
+TIME_QUANTUM = 0.001
+VALUE_QUANTUM = 0.01
+
+#number of raw samples per chunk (30 minutes at 2 s)
+CHUNK = 900
+
+#interval at which the open chunk and the rollups are written [s]
+#NOTE the process may be killed at any time (e.g. a program stopped from the GUI)
+FLUSH = 60.
+
+#rollup tiers: name and interval [s]
+TIERS = [("minute", 60), ("hour", 3600)]
+
+#default retention of the raw samples and of the rollup tiers [days]
+RETENTION = (7., 90., 3650.)
+
+#******************************************
+#database schema
+#NOTE the raw samples are stored in compressed chunks, the rollups as rows
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS raw (
+    chamber TEXT,
+    variable INTEGER,
+    start REAL,
+    end REAL,
+    n INTEGER,
+    data BLOB);
+CREATE INDEX IF NOT EXISTS raw_series ON raw (chamber, variable, end);
+""" + "".join("""
+CREATE TABLE IF NOT EXISTS %s (
+    chamber TEXT,
+    variable INTEGER,
+    t REAL,
+    min REAL,
+    mean REAL,
+    max REAL,
+    n INTEGER,
+    PRIMARY KEY (chamber, variable, t));
+"""%name for name, _ in TIERS)
+
+#******************************************
+def __zigzag__(values):
+    """Map signed to unsigned integers (0, -1, 1, -2, ... to 0, 1, 2, 3, ...)."""
+    return (values << 1) ^ (values >> 63)
+
+#******************************************
+def __unzigzag__(values):
+    """Map unsigned integers back to signed integers."""
+    return (values >> 1) ^ -(values & 1)
+
+#******************************************
+def __varint__(values, out):
+    """Append unsigned integers to a bytearray as varints (7 bits per byte, lowest first)."""
+
+    for value in values:
+        value = int(value)
+        while value >= 0x80:
+            out.append((value & 0x7f) | 0x80)
+            value >>= 7
+        out.append(value)
+
+    return out
+
+#******************************************
+def __unvarint__(data, n, offset=0):
+    """Read n varints from bytes starting at an offset.
+
+    Return the integers and the offset after the last one.
+    """
+
+    values = np.empty(n, dtype=np.int64)
+    for ii in range(n):
+        value, shift = 0, 0
+        while True:
+            byte = data[offset]
+            offset += 1
+            value |= (byte & 0x7f) << shift
+            shift += 7
+            if byte < 0x80:
+                break
+        values[ii] = value
+
+    return values, offset
+
+#******************************************
+def encode(times, values):
+    """Encode a time series.
+
+    The times [s] are quantized to TIME_QUANTUM and delta-of-delta encoded, so that regular sampling costs about a byte per sample;
+    the values are quantized to VALUE_QUANTUM and delta encoded.
+    The differences are zigzag mapped and packed as varints, all times first and then all values.
+    """
+
+    times = np.round(np.asarray(times, dtype=float)/TIME_QUANTUM).astype(np.int64)
+    values = np.round(np.asarray(values, dtype=float)/VALUE_QUANTUM).astype(np.int64)
+
+    out = bytearray()
+    __varint__([len(times)], out)
+    __varint__(__zigzag__(np.diff(np.diff(times, prepend=0), prepend=0)), out)
+    __varint__(__zigzag__(np.diff(values, prepend=0)), out)
+
+    return bytes(out)
+
+#******************************************
+def decode(data):
+    """Decode a time series encoded with encode().
+
+    Return the times [s] and values arrays.
+    """
+
+    (n,), offset = __unvarint__(data, 1)
+    times, offset = __unvarint__(data, n, offset)
+    values, offset = __unvarint__(data, n, offset)
+
+    times = np.cumsum(np.cumsum(__unzigzag__(times)))*TIME_QUANTUM
+    values = np.cumsum(__unzigzag__(values))*VALUE_QUANTUM
+
+    return times, values
+
+#******************************************
+class archive:
+    """Archive the readings of a climate chamber control variable.
+
+    The raw samples are buffered and stored in compressed chunks.
+    The minute and hour rollups (min, mean, max) are accumulated as the samples come in and merged into the database.
+    Every FLUSH seconds the open chunk is rewritten and the rollups are merged, in a single transaction.
+    Data older than the retention of its tier is deleted when a chunk is complete.
+    """
+
+    #******************************************
+    def __init__(self, path, chamber, variable=1, retention=RETENTION, clock=None):
+        """Initialize the archive.
+
+        The retention of the raw samples and of the minute and hour rollups is measured in days.
+        """
+
+        self.path = path
+        self.chamber = chamber
+        self.variable = variable
+        self.retention = retention
+        self.clock = clock if clock is not None else time
+        self.times = []
+        self.values = []
+        self.chunk = None
+        self.flushed = None
+        self.rollups = [None for _ in TIERS]
+        self.merged = []
+        self.db = None
+
+        return
+
+    #******************************************
+    def __connect__(self):
+        """Open the archive database, creating it if needed."""
+
+        if self.db is None:
+            self.db = connect(self.path)
+
+        return self.db
+
+    #******************************************
+    def add(self, t, value):
+        """Add a sample: time [s] and value."""
+
+        self.times.append(t)
+        self.values.append(value)
+
+        #rollups
+        #NOTE the completed rollups are merged into the database at the next flush
+        for ii, (_, interval) in enumerate(TIERS):
+            start = t - t%interval
+            rollup = self.rollups[ii]
+            if rollup is not None and rollup[0] != start:
+                self.merged.append((ii, rollup))
+                rollup = None
+            if rollup is None:
+                self.rollups[ii] = [start, value, value, value, 1]
+            else:
+                rollup[1] = min(rollup[1], value)
+                rollup[2] += value
+                rollup[3] = max(rollup[3], value)
+                rollup[4] += 1
+
+        #raw samples
+        if self.flushed is None:
+            self.flushed = t
+        if len(self.times) >= CHUNK or t - self.flushed >= FLUSH:
+            self.flush()
+
+        return
+
+    #******************************************
+    def __merge__(self, db, tier, rollup):
+        """Merge a rollup of a tier into the database."""
+
+        start, low, total, high, n = rollup
+        db.execute(
+            ("INSERT INTO %s VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (chamber, variable, t) DO UPDATE SET "
+            "min = MIN(min, excluded.min), mean = (mean*n + excluded.mean*excluded.n)/(n + excluded.n), max = MAX(max, excluded.max), n = n + excluded.n")%TIERS[tier][0],
+            (self.chamber, self.variable, start, low, total/n, high, n))
+
+        return
+
+    #******************************************
+    def flush(self):
+        """Store the buffered samples and the rollups in a single transaction.
+
+        The open chunk is rewritten until it holds CHUNK samples.
+        """
+
+        #NOTE partial rollups are merged with the following samples of the same interval
+        merged = self.merged + [(ii, rollup) for ii, rollup in enumerate(self.rollups) if rollup is not None]
+        with self.__connect__() as db:
+            for ii, rollup in merged:
+                self.__merge__(db, ii, rollup)
+            if len(self.times) > 0:
+                row = (self.times[0], self.times[-1], len(self.times), encode(self.times, self.values))
+                if self.chunk is None:
+                    self.chunk = db.execute("INSERT INTO raw VALUES (?, ?, ?, ?, ?, ?)", (self.chamber, self.variable) + row).lastrowid
+                else:
+                    db.execute("UPDATE raw SET start = ?, end = ?, n = ?, data = ? WHERE rowid = ?", row + (self.chunk,))
+        self.merged = []
+        self.rollups = [None for _ in TIERS]
+        self.flushed = self.times[-1] if len(self.times) > 0 else None
+
+        #complete chunk
+        if len(self.times) >= CHUNK:
+            self.times, self.values, self.chunk = [], [], None
+            self.prune()
+
+        return
+
+    #******************************************
+    def prune(self, now=None):
+        """Delete the data older than the retention of its tier."""
+
+        now = now if now is not None else self.clock.time()
+        with self.__connect__() as db:
+            db.execute("DELETE FROM raw WHERE chamber = ? AND variable = ? AND end < ?", (self.chamber, self.variable, now - self.retention[0]*86400))
+            for (name, _), retention in zip(TIERS, self.retention[1:]):
+                db.execute("DELETE FROM %s WHERE chamber = ? AND variable = ? AND t < ?"%name, (self.chamber, self.variable, now - retention*86400))
+
+        return
+
+    #******************************************
+    def close(self):
+        """Store everything and close the archive database."""
+
+        self.flush()
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+        return
+
+    #******************************************
+    def callback(self, event, **fields):
+        """Archive the readings of climatechambercontroller.cycle events."""
+
+        try:
+            if event == "reading":
+                if self.variable == 1:
+                    self.add(self.clock.time(), fields["actual"])
+                elif self.variable in fields.get("variables", []):
+                    self.add(self.clock.time(), fields["actuals"][fields["variables"].index(self.variable)])
+            elif event == "end":
+                self.close()
+
+        #NOTE the archive must never stop a program
+        except sqlite3.Error as e:
+            logging.error("there was an error while archiving the readings: %s"%e)
+
+        return None
+
+#******************************************
+def connect(path):
+    """Open the archive database, creating it if needed."""
+
+    db = sqlite3.connect(path, timeout=10.)
+    db.executescript(SCHEMA)
+
+    return db
+
+#******************************************
+def query(path, chamber, start, end, variable=1, points=1000):
+    """Query a time series between two times [s].
+
+    The finest tier (raw, minute or hour) with at most the given number of points over the time range is used.
+    Return the tier name and the time [s], min, mean and max arrays (the same values for the raw samples).
+    """
+
+    db = connect(path)
+    try:
+
+        #------------------------------------------
+        #raw samples
+        #NOTE the number of raw samples is estimated from the chunks
+        n, span = db.execute(
+            "SELECT SUM(n), SUM(end - start) FROM raw WHERE chamber = ? AND variable = ? AND end >= ? AND start <= ?",
+            (chamber, variable, start, end)).fetchone()
+        if n is not None and (n if span <= 0 else n*min(1., (end - start)/span)) <= points:
+            times, values = [], []
+            for (data,) in db.execute(
+                "SELECT data FROM raw WHERE chamber = ? AND variable = ? AND end >= ? AND start <= ? ORDER BY start",
+                (chamber, variable, start, end)):
+                t, v = decode(data)
+                times.append(t)
+                values.append(v)
+            times, values = np.concatenate(times), np.concatenate(values)
+
+            #NOTE the times are quantized, the time range is widened accordingly
+            selected = (times >= start - TIME_QUANTUM/2.) & (times <= end + TIME_QUANTUM/2.)
+            if np.any(selected):
+                return "raw", times[selected], values[selected], values[selected], values[selected]
+
+        #------------------------------------------
+        #rollups
+        for name, interval in TIERS:
+            if (end - start)/interval <= points or name == TIERS[-1][0]:
+                rows = db.execute(
+                    "SELECT t, min, mean, max FROM %s WHERE chamber = ? AND variable = ? AND t >= ? AND t <= ? ORDER BY t"%name,
+                    (chamber, variable, start - start%interval, end)).fetchall()
+                if len(rows) > 0 or name == TIERS[-1][0]:
+                    rows = np.array(rows, dtype=float).reshape(-1, 4)
+                    return name, rows[:, 0], rows[:, 1], rows[:, 2], rows[:, 3]
+
+    finally:
+        db.close()
+
+#******************************************
+if __name__ == "__main__":
+
+    #------------------------------------------
+    #import stuff
+    import argparse, datetime
+
+    #------------------------------------------
+    #input arguments
+    parser = argparse.ArgumentParser(description="query the climate chamber telemetry archive")
+    parser.add_argument("archive", type=str, help="telemetry archive database")
+    parser.add_argument("-c", "--chamber", dest="chamber", type=str, required=True, help="climate chamber address:port/ID")
+    parser.add_argument("--variable", dest="variable", type=int, required=False, default=1, help="control variable (1: temperature, 2: humidity)")
+    parser.add_argument("--since", dest="since", type=str, required=False, default=None, help="start date (YYYY-MM-DD, default: one day ago)")
+    parser.add_argument("--until", dest="until", type=str, required=False, default=None, help="end date (YYYY-MM-DD, default: now)")
+    parser.add_argument("-n", "--points", dest="points", type=int, required=False, default=1000, help="maximum number of points")
+    parser.add_argument("--prune", dest="prune", type=float, nargs=3, required=False, default=None, help="delete the data older than the retention [days] of the raw samples and of the minute and hour rollups")
+    args = parser.parse_args()
+
+    def timestamp(date):
+        return time.mktime(datetime.datetime.strptime(date, "%Y-%m-%d").timetuple())
+
+    #------------------------------------------
+    #prune
+    if args.prune is not None:
+        archive(args.archive, args.chamber, args.variable, args.prune).prune()
+
+    #------------------------------------------
+    #query
+    else:
+        end = timestamp(args.until) if args.until is not None else time.time()
+        start = timestamp(args.since) if args.since is not None else end - 86400
+        tier, times, low, mean, high = query(args.archive, args.chamber, start, end, args.variable, args.points)
+        print("time,min,mean,max (%s)"%tier)
+        for row in zip(times, low, mean, high):
+            print("%.3f,%.2f,%.2f,%.2f"%row)
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+
+#******************************************
+#A module to identify climate chamber thermal models and predict thermal cycling program durations.
+
+#******************************************
+__author__ = "Francesco Guescini"
+__version__ = "0.0.0"
+
+#******************************************
+#import stuff
+import csv, json, logging, math
+import numpy as np
+import climatechambercontroller
+
+#******************************************
+#smallest tolerance used in predictions [C]
+#NOTE the first-order response never reaches the target exactly; this is the resolution of the readings
+TOLERANCE = 0.01
+
+#******************************************
+class thermalmodel:
+    """Piecewise first-order thermal model of a climate chamber.
+
+    The actual temperature T approaches the nominal temperature Tn as dT/dt = (Tn - T)/tau,
+    with separate time constants [s] and maximum rates [C/s] when heating and cooling.
+    """
+
+    #******************************************
+    def __init__(self, tau_heat=600., tau_cool=600., rate_heat=0.05, rate_cool=0.05):
+        """Initialize the thermal model."""
+
+        self.tau_heat = tau_heat
+        self.tau_cool = tau_cool
+        self.rate_heat = rate_heat
+        self.rate_cool = rate_cool
+
+        return
+
+    #******************************************
+    def __repr__(self):
+        return "thermalmodel(tau_heat=%.1f, tau_cool=%.1f, rate_heat=%.4f, rate_cool=%.4f)"%(
+            self.tau_heat, self.tau_cool, self.rate_heat, self.rate_cool)
+
+    #******************************************
+    def derivative(self, actual, nominal):
+        """Rate of change of the actual temperature [C/s]."""
+
+        if nominal >= actual:
+            return min((nominal - actual)/self.tau_heat, self.rate_heat)
+        return max((nominal - actual)/self.tau_cool, -self.rate_cool)
+
+    #******************************************
+    def rampTime(self, start, target, tolerance=0.1, rate=0.):
+        """Predict the time [s] needed to go from start to target within tolerance.
+
+        An optional ramp rate [C/minute] limits the rate of the nominal temperature.
+        """
+
+        tolerance = max(tolerance, TOLERANCE)
+        distance = abs(target - start)
+        if distance <= tolerance:
+            return 0.
+
+        #time constant and maximum rate
+        tau, rmax = (self.tau_heat, self.rate_heat) if target > start else (self.tau_cool, self.rate_cool)
+        if rate > 0:
+            rmax = min(rmax, rate/60.)
+
+        #linear (rate-limited) phase down to the distance at which the first-order response becomes slower
+        linear = rmax*tau
+        if linear <= tolerance:
+            return (distance - tolerance)/rmax
+        if distance <= linear:
+            return tau*math.log(distance/tolerance)
+        return (distance - linear)/rmax + tau*math.log(linear/tolerance)
+
+    #******************************************
+    def save(self, path):
+        """Save the model parameters to a JSON file."""
+        with open(path, "w") as f:
+            json.dump(vars(self), f, indent=4)
+        return
+
+    #******************************************
+    @classmethod
+    def load(cls, path):
+        """Load the model parameters from a JSON file."""
+        with open(path, "r") as f:
+            return cls(**json.load(f))
+
+#******************************************
+def loadHistory(path):
+    """Load a temperature history.
+
+    Either a CSV file with time, actual and nominal temperature columns (as printed by --watch)
+    or a SIMSERV trace (as written by simservtrace.tracer) can be used.
+    Return time [s], actual and nominal temperature [C] arrays.
+    """
+
+    history = []
+
+    #------------------------------------------
+    #SIMSERV trace
+    #NOTE each actual temperature reading is paired with the latest nominal temperature reading
+    if path.endswith(".jsonl"):
+        nominal = None
+        with open(path, "r") as f:
+            for line in f:
+                if line.strip() == "":
+                    continue
+                record = json.loads(line)
+                request, response = record["request"], record["response"]
+                if response[0] != "1" or len(request) < 2 or request[1] != "1":
+                    continue
+                if request[0] == climatechambercontroller.GET_NOMINAL:
+                    nominal = float(response[1])
+                elif request[0] == climatechambercontroller.SET_NOMINAL:
+                    nominal = float(request[3])
+                elif request[0] == climatechambercontroller.GET_ACTUAL and nominal is not None:
+                    history.append((record["t"], float(response[1]), nominal))
+
+    #------------------------------------------
+    #CSV
+    else:
+        with open(path, "r") as f:
+            for row in csv.DictReader(f):
+                history.append((float(row["time"]), float(row["actual"]), float(row["nominal"])))
+
+    history = np.array(history, dtype=float).reshape(-1, 3)
+
+    return history[:, 0], history[:, 1], history[:, 2]
+
+#******************************************
+def fit(time, actual, nominal, saturation=0.8, quantile=95.):
+    """Fit a piecewise first-order thermal model to a temperature history.
+
+    The maximum heating and cooling rates are taken as a high quantile of the observed rates.
+    The time constants are then fitted by least squares to the samples below the saturation fraction of the maximum rates.
+    """
+
+    #------------------------------------------
+    #rates and distances from the nominal temperature at the interval midpoints
+    #NOTE gaps in the history (e.g. between concatenated histories) are skipped
+    dt = np.diff(time)
+    good = (dt > 0) & (dt < 10.*np.median(dt))
+    rate = np.diff(actual)[good]/dt[good]
+    error = (nominal[:-1] - 0.5*(actual[:-1] + actual[1:]))[good]
+
+    #------------------------------------------
+    #heating and cooling
+    model = thermalmodel()
+    for heating in [True, False]:
+        mask = (error > 0) & (rate > 0) if heating else (error < 0) & (rate < 0)
+        if np.count_nonzero(mask) < 2:
+            logging.warning("not enough %s samples: keeping the default parameters"%("heating" if heating else "cooling"))
+            continue
+
+        #maximum rate
+        rmax = np.percentile(np.abs(rate[mask]), quantile)
+
+        #time constant: rate = error/tau on the unsaturated samples
+        linear = mask & (np.abs(rate) < saturation*rmax)
+        if np.count_nonzero(linear) == 0:
+            linear = mask
+        k = np.linalg.lstsq(error[linear].reshape(-1, 1), rate[linear], rcond=None)[0][0]
+        if not k > 0 or not np.isfinite(1./k):
+            logging.warning("invalid %s time constant (1/%s): keeping the default parameters"%("heating" if heating else "cooling", k))
+            continue
+
+        if heating:
+            model.rate_heat, model.tau_heat = float(rmax), float(1./k)
+        else:
+            model.rate_cool, model.tau_cool = float(rmax), float(1./k)
+
+    return model
+
+#******************************************
+def predict(model, arglist, tolerance=0.1, start=20., rate=0.):
+    """Predict the timeline of a thermal cycling program.
+
+    The arguments are the same as those of climatechambercontroller.cycle; start is the initial actual temperature [C].
+    Return a list of (cycle, step, temperature [C], ramp start [s], ramp duration [s], dwell duration [s]) and the total duration [s].
+    """
+
+    ncycles = int(arglist[0])
+    steps = [(float(arglist[1]), float(arglist[2])), (float(arglist[3]), float(arglist[4]))]
+    final = (float(arglist[5]), float(arglist[6]))
+
+    #------------------------------------------
+    #program steps, as executed by cycle
+    program = [(ii, jj + 1, temp, interval) for ii in range(ncycles) for jj, (temp, interval) in enumerate(steps) if interval > 0]
+    if final[1] > 0:
+        program.append((ncycles, 3, final[0], final[1]))
+
+    #------------------------------------------
+    #timeline
+    timeline = []
+    t = 0.
+    actual = start
+    for ii, step, temp, interval in program:
+        ramp = model.rampTime(actual, temp, tolerance, rate)
+        timeline.append((ii, step, temp, t, ramp, 60.*interval))
+        t += ramp + 60.*interval
+        actual = temp
+
+    return timeline, t
+
+#******************************************
+if __name__ == "__main__":
+
+    #------------------------------------------
+    #import stuff
+    import argparse
+
+    #------------------------------------------
+    #logging setup
+    logging.basicConfig(format="%(levelname)s %(message)s", level=logging.INFO)
+
+    #------------------------------------------
+    #input arguments
+    parser = argparse.ArgumentParser(description="fit climate chamber thermal models and predict program durations")
+    parser.add_argument("-m", "--model", dest="model", type=str, required=True, help="thermal model file (JSON)")
+    parser.add_argument("-t", "--tolerance", dest="tolerance", type=float, required=False, default=0.1, help="temperature tolerance [C]")
+    parser.add_argument("--rate", dest="rate", type=float, required=False, default=0., help="ramp rate [C/minute] (0: climate chamber rate)")
+    parser.add_argument("--start", dest="start", type=float, required=False, default=20., help="initial temperature [C]")
+
+    command_parser = parser.add_mutually_exclusive_group(required=True)
+    command_parser.add_argument("--fit", dest="fit", nargs="+", default=None, help="fit the model to temperature histories (CSV or SIMSERV trace)")
+    command_parser.add_argument("--predict", dest="predict", nargs=7, default=None, help="predict a thermal cycling program: n, t1 [C], i1 ['], t2 [C], i2 ['], t3 [C], i3 [']")
+    args = parser.parse_args()
+
+    #------------------------------------------
+    #fit
+    if args.fit is not None:
+        histories = [loadHistory(path) for path in args.fit]
+        model = fit(*[np.concatenate(columns) for columns in zip(*histories)])
+        model.save(args.model)
+        print(model)
+
+    #------------------------------------------
+    #predict
+    elif args.predict is not None:
+        timeline, duration = predict(thermalmodel.load(args.model), args.predict, args.tolerance, args.start, args.rate)
+        for ii, step, temp, start, ramp, dwell in timeline:
+            print("cycle %s step %s: %.2f C at %.0f\' (ramp %.1f\', dwell %.0f\')"%(ii, step, temp, start/60., ramp/60., dwell/60.))
+        print("duration: %.1f\'"%(duration/60.))